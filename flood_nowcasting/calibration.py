@@ -0,0 +1,302 @@
+"""
+Threshold calibration
+Replays a historical river level series through the nowcast and state calculation for a grid of warn / wet thresholds
+(and optionally fit window lengths and forecast horizons) and scores each candidate against observed flooding of the
+path, so the Location thresholds can be tuned from history rather than from single observations
+"""
+# pylint: disable=R0913,R0914
+import argparse
+import csv
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from itertools import product
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from entities import FloodStates
+
+try:
+    from flood_nowcasting import FORECAST_HORIZONS, FloodNowcasting
+except ImportError:  # the package shadows the module when the repo root is on the path
+    from flood_nowcasting.flood_nowcasting import FORECAST_HORIZONS, FloodNowcasting
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# series and flood intervals shared with each worker process by the pool initialiser
+_SERIES: Tuple[List[int], List[float]] = ([], [])
+_INTERVALS: List[Tuple[int, int]] = []
+_MAX_LEAD = 0
+
+
+class CandidateScore(NamedTuple):
+    """ outcome of replaying one candidate configuration """
+    warn: float
+    wet: float
+    window: int
+    horizons: Tuple[int, int]
+    hit_rate: float
+    false_alarms: int
+    false_alarm_hours: float
+    mean_lead_minutes: Optional[float]
+    churn: int
+
+
+def parse_timestamp(value: str) -> int:
+    """
+    Convert an EA style timestamp to epoch seconds
+    :param value: str - eg 2021-01-28T17:45:00Z
+    :return: int
+    """
+    return int(datetime.strptime(value, TIMESTAMP_FORMAT).timestamp())
+
+
+def load_series(path: str) -> Tuple[List[int], List[float]]:
+    """
+    Load a historical series as downloaded from the EA archive (csv with dateTime and value columns)
+    :param path: str
+    :return: Tuple[List[int], List[float]] - epoch seconds and levels in chronological order
+    """
+    with open(path, newline='', encoding='utf-8') as handle:
+        rows = sorted((parse_timestamp(row['dateTime']), float(row['value']))
+                      for row in csv.DictReader(handle) if row['value'])
+    return [row[0] for row in rows], [row[1] for row in rows]
+
+
+def load_intervals(path: str) -> List[Tuple[int, int]]:
+    """
+    Load the observed "path flooded" intervals (csv with start and end columns)
+    :param path: str
+    :return: List[Tuple[int, int]] - epoch seconds start and end of each flooding
+    """
+    with open(path, newline='', encoding='utf-8') as handle:
+        return sorted((parse_timestamp(row['start']), parse_timestamp(row['end'])) for row in csv.DictReader(handle))
+
+
+def forecast_series(times: Sequence[int], levels: Sequence[float], window: int,
+                    horizons: Tuple[int, int] = FORECAST_HORIZONS) -> List[Tuple[int, float, Sequence[float]]]:
+    """
+    Run the nowcast over every window of the series as the live run would have seen it
+    :param times: Sequence[int] - epoch seconds
+    :param levels: Sequence[float]
+    :param window: int - number of readings in each fit
+    :param horizons: Tuple[int, int] - seconds ahead to forecast
+    :return: List[Tuple[int, float, Sequence[float]]] - timestamp, current level and forecast for each step
+    """
+    steps = []
+    for end in range(window, len(times) + 1):
+        # rebase as get_data does - big numbers don't fit well
+        x_values = [time - times[end - window] for time in times[end - window:end]]
+        y_values = levels[end - window:end]
+        steps.append((times[end - 1], y_values[-1], FloodNowcasting.nowcast(x_values, y_values, horizons)))
+    return steps
+
+
+def replay_states(steps: List[Tuple[int, float, Sequence[float]]], warn: float, wet: float) -> List[FloodStates]:
+    """
+    Feed the forecasts through the state calculation, starting dry
+    :param steps: List[Tuple[int, float, Sequence[float]]] - output of forecast_series
+    :param warn: float
+    :param wet: float
+    :return: List[FloodStates] - state after each step
+    """
+    state = FloodStates.DRY
+    states = []
+    for _, current_level, forecast in steps:
+        state = FloodNowcasting.calculate_new_state(
+            prior_state=state,
+            current_level=current_level,
+            forecast=forecast,
+            warn_threshold=warn,
+            wet_threshold=wet
+        )
+        states.append(state)
+    return states
+
+
+def score(times: Sequence[int], states: Sequence[FloodStates], intervals: Sequence[Tuple[int, int]],
+          max_lead: int) -> Tuple[float, int, float, Optional[float], int]:
+    """
+    Score a replayed state sequence against the observed flooding.
+    An alert is a run of consecutive non DRY states, lasting until the state returns to DRY. A flood is hit if an alert
+    is active at any point from max_lead seconds before it starts until it ends, with lead time measured from the start
+    of that alert to the start of the flood (negative if the alert was late) and capped at max_lead. An alert that
+    overlaps no flood is a false alarm, and time spent in alert outside those windows counts against the candidate so
+    always alerting can't score well.
+    :param times: Sequence[int] - epoch seconds of each state
+    :param states: Sequence[FloodStates]
+    :param intervals: Sequence[Tuple[int, int]] - observed flooding
+    :param max_lead: int - seconds before a flood an alert still counts towards it
+    :return: Tuple[float, int, float, Optional[float], int] - hit rate, false alarms, hours alerting outside any flood
+                                                              window, mean lead in minutes, state changes
+    """
+    alerts = []
+    churn = 0
+    prior = FloodStates.DRY
+    for time, state in zip(times, states):
+        if state != prior:
+            churn += 1
+            if prior == FloodStates.DRY:
+                alerts.append([time, time])
+        if state != FloodStates.DRY or prior != FloodStates.DRY:
+            alerts[-1][1] = time
+        prior = state
+
+    leads = []
+    matched = set()
+    for start, end in intervals:
+        overlapping = [index for index, (alert_start, alert_end) in enumerate(alerts)
+                       if alert_start <= end and alert_end >= start - max_lead]
+        if overlapping:
+            matched.update(overlapping)
+            leads.append(min(start - alerts[overlapping[0]][0], max_lead))
+    hit_rate = len(leads) / len(intervals) if intervals else 0.0
+    mean_lead = sum(leads) / len(leads) / 60 if leads else None
+
+    windows = _merge([(start - max_lead, end) for start, end in intervals])
+    outside = sum(alert_end - alert_start - sum(max(0, min(alert_end, end) - max(alert_start, start))
+                                                for start, end in windows)
+                  for alert_start, alert_end in alerts)
+    return hit_rate, len(alerts) - len(matched), outside / 3600, mean_lead, churn
+
+
+def _merge(windows: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """ combine overlapping windows so time in more than one isn't counted twice """
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _init_worker(series: Tuple[List[int], List[float]], intervals: List[Tuple[int, int]], max_lead: int):
+    """ hand the shared data to a worker process once rather than with every task """
+    # pylint: disable=W0603
+    global _SERIES, _INTERVALS, _MAX_LEAD
+    _SERIES, _INTERVALS, _MAX_LEAD = series, intervals, max_lead
+
+
+@lru_cache(maxsize=8)
+def _cached_forecasts(window: int, horizons: Tuple[int, int]) -> List[Tuple[int, float, Sequence[float]]]:
+    """ the fit doesn't depend on thresholds so only do it once per window and horizons in each worker """
+    return forecast_series(_SERIES[0], _SERIES[1], window, horizons)
+
+
+def _evaluate(window: int, horizons: Tuple[int, int], thresholds: List[Tuple[float, float]]) -> List[CandidateScore]:
+    """ score a batch of threshold pairs sharing a fit configuration """
+    steps = _cached_forecasts(window, horizons)
+    times = [step[0] for step in steps]
+    results = []
+    for warn, wet in thresholds:
+        states = replay_states(steps, warn, wet)
+        results.append(CandidateScore(warn, wet, window, horizons, *score(times, states, _INTERVALS, _MAX_LEAD)))
+    return results
+
+
+def frange(start: float, stop: float, step: float) -> List[float]:
+    """
+    Inclusive float range, rounded to avoid accumulating error
+    :param start: float
+    :param stop: float
+    :param step: float
+    :return: List[float]
+    """
+    count = int(round((stop - start) / step)) + 1
+    return [round(start + step * index, 6) for index in range(count)]
+
+
+def rank(candidate: CandidateScore) -> Tuple[float, float, int, float, int]:
+    """
+    Sort key, best first - most floods caught, then least time and fewest false alarms, most warning and least
+    flip-flopping
+    :param candidate: CandidateScore
+    :return: Tuple[float, float, int, float, int]
+    """
+    mean_lead = float('-inf') if candidate.mean_lead_minutes is None else candidate.mean_lead_minutes
+    return -candidate.hit_rate, candidate.false_alarm_hours, candidate.false_alarms, -mean_lead, candidate.churn
+
+
+def calibrate(series: Tuple[List[int], List[float]], intervals: List[Tuple[int, int]], warn_levels: List[float],
+              wet_levels: List[float], *, windows: Sequence[int] = (24,),
+              horizons: Sequence[Tuple[int, int]] = (FORECAST_HORIZONS,), max_lead: int = 3 * 3600,
+              workers: Optional[int] = None) -> List[CandidateScore]:
+    """
+    Search every candidate configuration across processes
+    :param series: Tuple[List[int], List[float]] - epoch seconds and levels in chronological order
+    :param intervals: List[Tuple[int, int]] - observed flooding
+    :param warn_levels: List[float]
+    :param wet_levels: List[float] - pairs with warn above wet are skipped
+    :param windows: Sequence[int] - fit window lengths (readings)
+    :param horizons: Sequence[Tuple[int, int]] - forecast horizon pairs (seconds)
+    :param max_lead: int - seconds before a flood an alert still counts towards it
+    :param workers: Optional[int] - processes to use, defaults to the number of cores
+    :return: List[CandidateScore] - best first
+    """
+    workers = workers or os.cpu_count() or 1
+    pairs = [(warn, wet) for warn, wet in product(warn_levels, wet_levels) if warn <= wet]
+    # enough chunks to keep every core busy, few enough that each worker reuses its cached fits
+    chunk_size = max(1, len(pairs) // (workers * 4) + 1)
+    tasks = [(window, horizon, pairs[start:start + chunk_size])
+             for window, horizon in product(windows, horizons)
+             for start in range(0, len(pairs), chunk_size)]
+    logging.info("evaluating %s candidates in %s tasks on %s processes", len(pairs) * len(windows) * len(horizons),
+                 len(tasks), workers)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(series, intervals, max_lead)) as executor:
+        for batch in executor.map(_evaluate, *zip(*tasks)):
+            results.extend(batch)
+    results.sort(key=rank)
+    return results
+
+
+def args():
+    """
+    Generate args for app
+    :return: dictionary of arguments
+    """
+    parser = argparse.ArgumentParser("Calibrate warn / wet thresholds against historical flooding")
+    parser.add_argument("--series", type=str, required=True, help="csv of readings with dateTime and value columns")
+    parser.add_argument("--floods", type=str, required=True, help="csv of observed flooding with start and end columns")
+    parser.add_argument("--warn", type=float, nargs=3, required=True, metavar=("START", "STOP", "STEP"),
+                        help="warn thresholds to search (m)")
+    parser.add_argument("--wet", type=float, nargs=3, required=True, metavar=("START", "STOP", "STEP"),
+                        help="wet thresholds to search (m)")
+    parser.add_argument("--windows", type=int, nargs="+", default=[24], help="fit window lengths (readings)")
+    parser.add_argument("--horizons", type=str, nargs="+", default=[f"{FORECAST_HORIZONS[0]},{FORECAST_HORIZONS[1]}"],
+                        help="forecast horizon pairs in seconds, eg 1800,3600")
+    parser.add_argument("--max_lead", type=int, default=180, help="minutes before a flood an alert counts towards it")
+    parser.add_argument("--workers", type=int, default=None, help="processes to use (default all cores)")
+    parser.add_argument("--top", type=int, default=20, help="number of candidates to report")
+    parser.add_argument("--output", type=str, default=None, help="write every candidate to this csv")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    args = args()
+    scores = calibrate(
+        series=load_series(args.series),
+        intervals=load_intervals(args.floods),
+        warn_levels=frange(*args.warn),
+        wet_levels=frange(*args.wet),
+        windows=args.windows,
+        horizons=[tuple(int(value) for value in pair.split(",")) for pair in args.horizons],
+        max_lead=args.max_lead * 60,
+        workers=args.workers
+    )
+    print("warn   wet    window horizons    hit rate false alarms (hours) lead (mins) churn")
+    for result in scores[:args.top]:
+        lead = "-" if result.mean_lead_minutes is None else f"{result.mean_lead_minutes:.0f}"
+        print(f"{result.warn:<6} {result.wet:<6} {result.window:<6} {str(result.horizons):<11} "
+              f"{result.hit_rate:<8.2f} {result.false_alarms:<5} {result.false_alarm_hours:<14.1f} {lead:<11} "
+              f"{result.churn}")
+    if args.output:
+        with open(args.output, "w", newline='', encoding='utf-8') as output:
+            writer = csv.writer(output)
+            writer.writerow(CandidateScore._fields)
+            writer.writerows(scores)
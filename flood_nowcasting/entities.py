@@ -1,10 +1,10 @@
 """
 Entities for the flood nowcasting project
 """
-# pylint: disable=R0913,R0903
+# pylint: disable=R0913,R0917,R0903,R0902
 
 from enum import Enum
-from typing import Dict
+from typing import Dict, Optional, Sequence
 
 
 class FloodStates(Enum):
@@ -54,7 +54,8 @@ class Location:
     """
 
     def __init__(self, name: str, monitoring_station: str, wet: float,
-                 warn: float, messages: Dict[FloodStates, str]):
+                 warn: float, messages: Dict[FloodStates, str], confidence: Optional[float] = None,
+                 lat: Optional[float] = None, long: Optional[float] = None, flood_areas: Sequence[str] = ()):
         """
 
         :param name: str - Name of the location. must be unique
@@ -63,6 +64,11 @@ class Location:
         :param warn: float - river depth at monitoring station at which a warning should be issued
         :param messages: Dict[FloodStates,str] - list of messages to output for the change to each state. Should
                                                     contain every FloodStates
+        :param confidence: Optional[float] - if set, judge the thresholds on the upper bound of a prediction interval
+                                             with this coverage (eg 0.8) rather than the bare forecast
+        :param lat: Optional[float] - position of the location, see station_catalogue to find its monitoring station
+        :param long: Optional[float]
+        :param flood_areas: Sequence[str] - EA flood area ids nearby, to report official warnings alongside
         """
         self.name = name
         self.monitoring_station = monitoring_station
@@ -71,6 +77,10 @@ class Location:
         if len(messages) != len(FloodStates):
             raise AttributeError("It seems you have the wrong number of messages")
         self.messages = messages
+        self.confidence = confidence
+        self.lat = lat
+        self.long = long
+        self.flood_areas = flood_areas
 
     def get_message(self, state: FloodStates) -> str:
         """
@@ -79,3 +89,37 @@ class Location:
         :return: str
         """
         return self.messages[state]
+
+
+class Account:
+    """
+    Publishing account configuration object
+    """
+
+    def __init__(self, name: str, user_id: str, app_key: str, app_secret: str, access_token: str,
+                 access_token_secret: str, locations: Optional[Sequence[str]] = None):
+        """
+
+        :param name: str - Name of the account. must be unique
+        :param user_id: str - twitter account the states are published to and read back from
+        :param app_key: str
+        :param app_secret: str
+        :param access_token: str
+        :param access_token_secret: str
+        :param locations: Optional[Sequence[str]] - names of the locations to publish, None for all of them
+        """
+        self.name = name
+        self.user_id = user_id
+        self.app_key = app_key
+        self.app_secret = app_secret
+        self.access_token = access_token
+        self.access_token_secret = access_token_secret
+        self.locations = locations
+
+    def covers(self, location: Location) -> bool:
+        """
+        Whether the account publishes a location
+        :param location: Location
+        :return: bool
+        """
+        return self.locations is None or location.name in self.locations
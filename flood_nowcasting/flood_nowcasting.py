@@ -5,74 +5,256 @@ Useful where key infrastructure is within flood defences and not considered "in
 - such as the E1 / NCN34 along the edge of the river exe between Exeter St Davids and Exeter Quay
 """
 import argparse
+import asyncio
+import copy
 import logging
-from typing import Set
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+from urllib.request import urlopen
 
 import numpy.polynomial.polynomial as poly
 import tweepy
 from numpy.core.multiarray import ndarray
 
-from entities import FloodStates, Location
-from load_ea_data import get_data
+from entities import Account, FloodStates, Location
+from flood_warnings import (AREAS_CACHE_PATH, FLOODS_URL, FloodAreaCache, FloodWarning, FloodWarningIndex,
+                            get_flood_warnings)
+from load_ea_data import REQUEST_TIMEOUT, get_data
+from pipeline import run_pipeline
+from prediction_interval import forecast_interval
+from replay import Cassette
+from status_feed import SHARD_DIRECTORY, LocationStatus, slug, write_status_feed
+
+# seconds ahead of the latest reading to forecast - +30 and +60 minutes
+FORECAST_HORIZONS = (1800, 3600)
+
+DEFAULT_USER_ID = 'ExeFloodChannel'
+
+# seconds to wait on a publish - a run with a time limit only starts one with this long left
+PUBLISH_TIMEOUT = 5
 
 
 # import matplotlib.pyplot as plt
 class FloodNowcasting:
     """ nowcasting lib """
+    # pylint: disable=R0902
 
-    def __init__(self, app_key: str, app_secret: str, access_token: str, access_token_secret: str):
+    def __init__(self, app_key: str, app_secret: str, access_token: str, access_token_secret: str, *,
+                 timeout: float = REQUEST_TIMEOUT, floods_url: str = FLOODS_URL, status_dir: Optional[str] = None,
+                 user_id: str = DEFAULT_USER_ID, accounts: Sequence[Account] = (), cassette: Optional[Cassette] = None,
+                 areas_cache: Optional[str] = None, publish_timeout: float = PUBLISH_TIMEOUT):
         """
         Configure API
         :param app_key:str
         :param app_secret:str
         :param access_token: str
         :param access_token_secret:str
+        :param timeout: float - seconds to wait on any one EA or twitter request
+        :param floods_url: str - where to get the EA flood warnings from
+        :param status_dir: Optional[str] - directory to keep the static status feed in, if wanted
+        :param user_id: str - twitter account the credentials above publish to
+        :param accounts: Sequence[Account] - further accounts to publish to, sharing the data and forecasts
+        :param cassette: Optional[Cassette] - record the EA and twitter I/O, or play it back instead of the network
+        :param areas_cache: Optional[str] - file to keep the EA flood areas found around each location in
+        :param publish_timeout: float - seconds to wait on a publish, and so the least time left to start one in
         :return:
         """
-        auth = tweepy.OAuthHandler(app_key, app_secret)
-        auth.set_access_token(access_token, access_token_secret)
-        self.api = tweepy.API(auth)
+        # pylint: disable=R0913
+        self.timeout = timeout
+        self.publish_timeout = publish_timeout
+        self.cassette = cassette
+        self.opener = cassette.urlopen if cassette else urlopen
+        self.accounts = [Account(user_id, user_id, app_key, app_secret, access_token, access_token_secret)]
+        self.accounts += accounts
+        self.check_accounts(self.accounts)
+        self.apis = {account.name: self.connect(account) for account in self.accounts}
+        self.api = self.apis[user_id]
+        self.floods_url = floods_url
+        self.flood_areas = FloodAreaCache(areas_cache)
+        self.status_dir = status_dir
+
+    @staticmethod
+    def check_accounts(accounts: Sequence[Account]):
+        """
+        Make sure no account would replace another, or write its status feed over another's
+        :param accounts: Sequence[Account] - the first keeps the top of the status feed directory
+        """
+        names = set()
+        directories = {SHARD_DIRECTORY}
+        for account in accounts:
+            if account.name in names:
+                raise ValueError(f"More than one account named {account.name}")
+            names.add(account.name)
+            if account is not accounts[0]:
+                directory = slug(account.name)
+                if not directory or directory in directories:
+                    raise ValueError(f"Account {account.name} can't have its own status feed directory {directory!r}")
+                directories.add(directory)
 
     def main(self):
         """ Actually do something """
+        self.run()
 
-        # loop over locations
-        for location in self.get_locations():
-            # load up the data
-            logging.debug("loading station %s", location.name)
-            x_values, y_values, latest_timestamp = get_data(location)
-            message_suffix = f" (using data issued at: {latest_timestamp: %I:%M %p %d/%m/%Y})"
-            current_level = y_values[-1]
-            forecast_levels = self.nowcast(x_values, y_values)
-
-            # load the current published state and calculate the new state
-            current_output_state = self.get_current_output_state(location, len(message_suffix))
-            new_state = self.calculate_new_state(
-                prior_state=current_output_state,
-                current_level=current_level,
-                forecast=forecast_levels,
-                warn_threshold=location.warn,
-                wet_threshold=location.wet
-            )
+    def run(self, time_limit: Optional[float] = None) -> Dict[str, Dict[str, Optional[LocationStatus]]]:
+        """
+        Process the locations and accounts concurrently. Given a time limit, give up on any that haven't finished
+        within it - locations that did finish are still published.
+        :param time_limit: Optional[float] - seconds, None to wait for everything
+        :return: Dict[str, Dict[str, Optional[LocationStatus]]] - outcome by account then location name, None if it
+                                                                  didn't finish
+        """
+        locations = self.get_locations()
+        results = asyncio.run(run_pipeline(self, locations, self.accounts, time_limit))
+        for account in self.accounts:
+            self.write_status_feed((status for status in results[account.name].values() if status is not None),
+                                   [location.name for location in locations if account.covers(location)], account)
+        return results
+
+    def connect(self, account: Account) -> tweepy.API:
+        """
+        Configure the twitter API for an account
+        :param account: Account
+        :return: tweepy.API - None when playing back
+        """
+        if self.cassette and not self.cassette.record:
+            return None
+        auth = tweepy.OAuthHandler(account.app_key, account.app_secret)
+        auth.set_access_token(account.access_token, account.access_token_secret)
+        return tweepy.API(auth, timeout=self.timeout)
+
+    def write_status_feed(self, statuses: Iterable[LocationStatus], configured: Iterable[str],
+                          account: Optional[Account] = None):
+        """
+        Update the static status feed, if there is one. Accounts other than the first get their own sub directory.
+        :param statuses: Iterable[LocationStatus]
+        :param configured: Iterable[str] - names of every location the account publishes, any others are removed
+        :param account: Optional[Account] - defaults to the first
+        """
+        if self.status_dir:
+            directory = self.status_dir
+            if account is not None and account is not self.accounts[0]:
+                directory = os.path.join(self.status_dir, slug(account.name))
+            written = write_status_feed(directory, statuses, configured)
+            logging.debug("status feed updated %s", written)
+
+    def fetch(self, location: Location, timeout: Optional[float] = None) -> Tuple[List[int], List[float], datetime]:
+        """
+        Load the recent readings for a location
+        :param location: Location
+        :param timeout: Optional[float] - seconds, defaults to the configured timeout
+        :return: Tuple[List[int], List[float], datetime] - as get_data
+        """
+        return get_data(location, timeout=self.timeout if timeout is None else timeout, opener=self.opener)
+
+    def fetch_flood_warnings(self, locations: Iterable[Location] = (),
+                             timeout: Optional[float] = None) -> Optional[FloodWarningIndex]:
+        """
+        Load every EA flood warning in force, then link the locations to their flood areas if not already known with
+        whatever time is left - only informational so any failure doesn't stop the run
+        :param locations: Iterable[Location] - to find the flood areas of
+        :param timeout: Optional[float] - seconds for the whole step, defaults to the configured timeout
+        :return: Optional[FloodWarningIndex] - None if they couldn't be loaded
+        """
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        flood_warnings = None
+        try:
+            flood_warnings = get_flood_warnings(self.floods_url, timeout=max(0.0, deadline - time.monotonic()),
+                                                opener=self.opener)
+        except Exception as error:  # pylint: disable=broad-except
+            logging.warning("couldn't load flood warnings: %s", error)
+        try:
+            self.flood_areas.link(locations, timeout=max(0.0, deadline - time.monotonic()), opener=self.opener)
+        except Exception as error:  # pylint: disable=broad-except
+            logging.warning("couldn't look up flood areas: %s", error)
+        return flood_warnings
+
+    @staticmethod
+    def check_flood_warnings(location: Location, flood_warnings: Optional[FloodWarningIndex]) -> List[FloodWarning]:
+        """
+        Report any official warnings in force near a location
+        :param location: Location
+        :param flood_warnings: Optional[FloodWarningIndex]
+        :return: List[FloodWarning]
+        """
+        warnings = flood_warnings.for_location(location) if flood_warnings else []
+        for warning in warnings:
+            logging.info("station %s EA %s in force for %s", location.name, warning.severity, warning.description)
+        return warnings
 
-            logging.info("station %s old state:%s new state:%s  %s m [%s, %s] - threshold %s / %s", location.name,
-                         current_output_state.name,
-                         new_state.name, current_level, forecast_levels[0], forecast_levels[1], location.warn,
-                         location.wet)
-            if new_state != current_output_state:  # publicise change:
-                message = location.get_message(new_state)
-                message += message_suffix
-                self.publish(message)
-            #     print(f"published message {message}")
-            # else:
-            #     print(f"no change for location {location.name}")
+    @staticmethod
+    def message_suffix(latest_timestamp: datetime) -> str:
+        """
+        The data timestamp appended to every message
+        :param latest_timestamp: datetime
+        :return: str
+        """
+        return f" (using data issued at: {latest_timestamp: %I:%M %p %d/%m/%Y})"
+
+    @classmethod
+    def suffix_length(cls) -> int:
+        """
+        The suffix is the same length whatever the time, so the published states can be looked up before the data
+        has loaded
+        :return: int
+        """
+        return len(cls.message_suffix(datetime(2000, 1, 1)))
+
+    @classmethod
+    def forecast(cls, locations: Sequence[Location], x_values: List[int],
+                 y_values: List[float]) -> Dict[str, Tuple[ndarray, Optional[ndarray]]]:
+        """
+        Forecast the level for every location on a station from the one fit
+        :param locations: Sequence[Location] - those monitored by the station
+        :param x_values: List[int]
+        :param y_values: List[float]
+        :return: Dict[str, Tuple[ndarray, Optional[ndarray]]] - by location name, forecast levels and their upper
+                                                                bound if the location has a confidence level
+        """
+        confidences = sorted({location.confidence for location in locations if location.confidence})
+        if not confidences:
+            forecast_levels = cls.nowcast(x_values, y_values)
+            return {location.name: (forecast_levels, None) for location in locations}
+        # the point forecast comes from the same fit as the bounds for every confidence level
+        forecast_levels, _, upper = forecast_interval(x_values, y_values, FORECAST_HORIZONS, confidences)
+        bounds = dict(zip(confidences, upper))
+        return {location.name: (forecast_levels, bounds.get(location.confidence)) for location in locations}
+
+    def assess(self, location: Location, current_level: float, forecast_levels: ndarray,
+               forecast_upper: Optional[ndarray], current_output_state: FloodStates) -> FloodStates:
+        """
+        Work out the state to publish for a location
+        :param location: Location
+        :param current_level: float - the latest reading
+        :param forecast_levels: ndarray
+        :param forecast_upper: Optional[ndarray]
+        :param current_output_state: FloodStates - the currently published state
+        :return: FloodStates - the new state
+        """
+        # pylint: disable=R0913
+        new_state = self.calculate_new_state(
+            prior_state=current_output_state,
+            current_level=current_level,
+            forecast=forecast_levels,
+            warn_threshold=location.warn,
+            wet_threshold=location.wet,
+            forecast_upper=forecast_upper
+        )
+
+        logging.info("station %s old state:%s new state:%s  %s m [%s, %s] - threshold %s / %s", location.name,
+                     current_output_state.name,
+                     new_state.name, current_level, forecast_levels[0], forecast_levels[1], location.warn,
+                     location.wet)
+        return new_state
 
     @staticmethod
-    def nowcast(x_values, y_values):
+    def nowcast(x_values, y_values, horizons: Tuple[int, int] = FORECAST_HORIZONS):
         """
         generate the nowcast for the next hour
         :param x_values:
         :param y_values:
+        :param horizons: Tuple[int, int] - seconds after the last reading to forecast
         :return:
         """
         # estimate the coefficients
@@ -85,7 +267,7 @@ class FloodNowcasting:
         # plt.plot(x_values, y_values, 'o')
         # plt.show()
         # use the calculated coefficients to estimate t+30 and t+60 minutes
-        forecast_levels = poly.polyval([x_values[-1] + 1800, x_values[-1] + 3600], coefficients)
+        forecast_levels = poly.polyval([x_values[-1] + horizon for horizon in horizons], coefficients)
         return forecast_levels
 
     @staticmethod
@@ -102,6 +284,8 @@ class FloodNowcasting:
                 monitoring_station="45128",
                 wet=3.86,
                 warn=3.84,
+                lat=50.7205,
+                long=-3.5330,
                 messages={
                     FloodStates.DRY: "Flood defence path between Millers Crossing and the Quay is clear",
                     FloodStates.WARN: "Possibility of flooding soon on the flood defence path between "
@@ -120,6 +304,8 @@ class FloodNowcasting:
                 monitoring_station="45128",
                 wet=4.03,
                 warn=4.00,
+                lat=50.7260,
+                long=-3.5405,
                 messages={
                     FloodStates.DRY: "Flood defence path between St David's and Millers Crossing is clear",
                     FloodStates.WARN: "Possibility of flooding soon on the flood defence path between "
@@ -136,25 +322,66 @@ class FloodNowcasting:
         }
         return locations
 
-    def get_current_output_state(self, location: Location, suffix_len: int) -> FloodStates:
+    def get_current_output_state(self, location: Location, suffix_len: int,
+                                 account: Optional[Account] = None) -> FloodStates:
         """
         load the previously published output state
         :param location: Location
         :param suffix_len: int - how much to trim off the end
+        :param account: Optional[Account] - defaults to the first
         :return: FloodStates
         """
-        for page in tweepy.Cursor(self.api.user_timeline, user_id='ExeFloodChannel').pages():
-            for tweet in page:
-                if len(tweet.text) > suffix_len and tweet.text[:suffix_len * -1] in location.messages.values():
-                    for state in location.messages.keys():
-                        if location.messages[state] == tweet.text[:suffix_len * -1]:
-                            return state
+        return self.get_current_output_states([location], suffix_len, account)[location.name]
+
+    def get_current_output_states(self, locations: Iterable[Location], suffix_len: int,
+                                  account: Optional[Account] = None,
+                                  timeout: Optional[float] = None) -> Dict[str, FloodStates]:
+        """
+        load the previously published output state of several locations in one pass over the timeline
+        :param locations: Iterable[Location]
+        :param suffix_len: int - how much to trim off the end
+        :param account: Optional[Account] - defaults to the first
+        :param timeout: Optional[float] - seconds per request, defaults to the configured timeout
+        :return: Dict[str, FloodStates] - by location name
+        """
+        account = account or self.accounts[0]
+        # message -> (location name, state), only the newest tweet for each location counts
+        wanted = {}
+        for location in locations:
+            for state, message in location.messages.items():
+                wanted[message] = (location.name, state)
         # can't find a prior state - set to dry
-        return FloodStates.DRY
+        states = {name: FloodStates.DRY for name, _ in wanted.values()}
+        found = set()
+        for page in self.timeline(account, timeout):
+            for text in page:
+                if len(text) > suffix_len and text[:suffix_len * -1] in wanted:
+                    name, state = wanted[text[:suffix_len * -1]]
+                    if name not in found:
+                        found.add(name)
+                        states[name] = state
+            if len(found) == len(states):
+                break
+        return states
+
+    def timeline(self, account: Account, timeout: Optional[float] = None) -> Iterator[List[str]]:
+        """
+        Page through an account's tweets, newest first
+        :param account: Account
+        :param timeout: Optional[float] - seconds per request, defaults to the configured timeout
+        :return: Iterator[List[str]] - tweet texts, page by page
+        """
+        def pages():
+            for page in tweepy.Cursor(self.twitter(account, timeout).user_timeline, user_id=account.user_id).pages():
+                yield [tweet.text for tweet in page]
+
+        if self.cassette:
+            return self.cassette.pages(account.user_id, pages)
+        return pages()
 
     @staticmethod
     def calculate_new_state(prior_state: FloodStates, current_level: float, forecast: ndarray, warn_threshold: float,
-                            wet_threshold: float) -> FloodStates:
+                            wet_threshold: float, *, forecast_upper: Optional[ndarray] = None) -> FloodStates:
         """
         Calculate the new state for the warning at the given location
         :param prior_state: FloodStates - the old flood state
@@ -162,10 +389,15 @@ class FloodNowcasting:
         :param forecast: ndarray - a 2 deep array estimating +30 and +60 minutes based on the previous readings
         :param warn_threshold: float - the water depth warning level for the current location
         :param wet_threshold: float - the water depth considered flooding for the current location
+        :param forecast_upper: Optional[ndarray] - upper bound of the forecast's prediction interval. If given the
+                                                   thresholds are judged against it instead of the bare forecast, so
+                                                   warnings come earlier and clearing later rather than flip-flopping
         :return: FloodStates - the new flood state
         """
-        # pylint: disable=R0912
-        # allow too many branches
+        # pylint: disable=R0912,R0913
+        # allow too many branches and arguments
+        if forecast_upper is not None:
+            forecast = forecast_upper
         calc_state = prior_state
         if max([current_level] + list(forecast)) < warn_threshold:  # check if need to warn
             if prior_state >= FloodStates.WET:
@@ -200,19 +432,43 @@ class FloodNowcasting:
                     calc_state = FloodStates.WET
         return calc_state
 
-    def publish(self, message: str):
+    def twitter(self, account: Account, timeout: Optional[float] = None) -> tweepy.API:
+        """
+        The twitter API for an account
+        :param account: Account
+        :param timeout: Optional[float] - seconds per request, defaults to the configured timeout
+        :return: tweepy.API
+        """
+        api = self.apis[account.name]
+        if timeout is not None:
+            # the client is shared between threads, so change the timeout on a copy
+            api = copy.copy(api)
+            api.timeout = timeout
+        return api
+
+    def publish(self, message: str, account: Optional[Account] = None, timeout: Optional[float] = None):
         """
         Publish the message to twitter
         :param message: str
+        :param account: Optional[Account] - defaults to the first
+        :param timeout: Optional[float] - seconds, defaults to the configured timeout
         :return:
         """
-        try:
-            self.api.update_status(status=message)
-        except tweepy.HTTPException as error:
-            if 187 in error.api_codes:  # Status is a duplicate
-                pass
-            else:
-                raise
+        account = account or self.accounts[0]
+
+        def send():
+            try:
+                self.twitter(account, timeout).update_status(status=message)
+            except tweepy.HTTPException as error:
+                if 187 in error.api_codes:  # Status is a duplicate
+                    pass
+                else:
+                    raise
+
+        if self.cassette:
+            self.cassette.publish(account.user_id, message, send)
+        else:
+            send()
 
 
 def args():
@@ -221,16 +477,35 @@ def args():
     :return: dictionary of arguments
     """
     parser = argparse.ArgumentParser("Tweet the flood state")
-    parser.add_argument("--app_key", type=str, required=True, help="Twitter App Key")
-    parser.add_argument("--app_secret", type=str, required=True, help="Twitter App Secret")
-    parser.add_argument("--access_token", type=str, required=True, help="Twitter Account Access Token")
-    parser.add_argument("--access_token_secret", type=str, required=True, help="Twitter Account Access Token Secret")
+    parser.add_argument("--app_key", type=str, help="Twitter App Key")
+    parser.add_argument("--app_secret", type=str, help="Twitter App Secret")
+    parser.add_argument("--access_token", type=str, help="Twitter Account Access Token")
+    parser.add_argument("--access_token_secret", type=str, help="Twitter Account Access Token Secret")
+    parser.add_argument("--status_dir", type=str, default=None, help="Directory to write the static status feed to")
+    parser.add_argument("--record", type=str, default=None, help="Record the EA and twitter I/O to this file")
+    parser.add_argument("--replay", type=str, default=None, help="Play back recorded I/O instead of the network")
+    parser.add_argument("--areas_cache", type=str, default=AREAS_CACHE_PATH,
+                        help="File to keep the EA flood areas around each location in")
+    parser.add_argument("--realtime", action="store_true", help="Play back with the recorded timing")
+    parser.add_argument("--time_limit", type=float, default=None,
+                        help="Process locations concurrently, abandoning any not done within this many seconds")
     # process arguments
-    return parser.parse_args()
+    parsed = parser.parse_args()
+    # playing back never talks to twitter
+    if not parsed.replay and None in (parsed.app_key, parsed.app_secret, parsed.access_token,
+                                      parsed.access_token_secret):
+        parser.error("--app_key, --app_secret, --access_token and --access_token_secret are required unless replaying")
+    return parsed
 
 
 if __name__ == '__main__':
     args = args()
+    io_cassette = None
+    if args.record or args.replay:
+        io_cassette = Cassette(args.record or args.replay, record=bool(args.record), realtime=args.realtime)
     nowcast = FloodNowcasting(app_key=args.app_key, app_secret=args.app_secret, access_token=args.access_token,
-                              access_token_secret=args.access_token_secret)
-    nowcast.main()
+                              access_token_secret=args.access_token_secret, status_dir=args.status_dir,
+                              cassette=io_cassette, areas_cache=args.areas_cache)
+    nowcast.run(args.time_limit)
+    if args.record:
+        io_cassette.save()
@@ -0,0 +1,150 @@
+"""
+EA flood warnings
+The official warnings don't cover the defended paths, but it's still worth knowing when one is in force nearby. The
+whole feed is fetched once per run and indexed by flood area, so checking a location is a dictionary lookup per area.
+The flood areas around each location are looked up once from its position and cached.
+"""
+# pylint: disable=R0903
+import json
+import os
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+from urllib.request import urlopen
+
+from entities import Location
+from load_ea_data import REQUEST_TIMEOUT
+
+FLOODS_URL = "https://environment.data.gov.uk/flood-monitoring/id/floods"
+FLOOD_AREAS_URL = "https://environment.data.gov.uk/flood-monitoring/id/floodAreas"
+
+AREAS_CACHE_PATH = "flood_areas.json"
+
+# km around a location to take flood areas from
+AREA_DIST = 1
+
+# severityLevel 4 is "warning no longer in force"
+IN_FORCE = (1, 2, 3)
+
+
+class FloodWarning(NamedTuple):
+    """ a flood alert or warning from the EA feed """
+    area_id: str
+    description: str
+    severity: str
+    severity_level: int
+    time_raised: Optional[str]
+    message: Optional[str]
+
+
+class FloodWarningIndex:
+    """ the warnings from one fetch of the feed by flood area """
+
+    def __init__(self, warnings: Iterable[FloodWarning]):
+        """
+        :param warnings: Iterable[FloodWarning]
+        """
+        self.by_area: Dict[str, FloodWarning] = {warning.area_id: warning for warning in warnings}
+
+    def for_location(self, location: Location) -> List[FloodWarning]:
+        """
+        The warnings in force in any of a location's flood areas
+        :param location: Location
+        :return: List[FloodWarning] - most severe first
+        """
+        warnings = [self.by_area[area] for area in location.flood_areas if area in self.by_area]
+        return sorted((warning for warning in warnings if warning.severity_level in IN_FORCE),
+                      key=lambda warning: warning.severity_level)
+
+
+def parse_warning(item: dict) -> FloodWarning:
+    """
+    Convert an item from the EA api
+    :param item: dict
+    :return: FloodWarning
+    """
+    return FloodWarning(
+        area_id=item['floodAreaID'],
+        description=item.get('description', ''),
+        severity=item.get('severity', ''),
+        severity_level=int(item.get('severityLevel', 4)),
+        time_raised=item.get('timeRaised'),
+        message=item.get('message')
+    )
+
+
+def get_flood_warnings(url: str = FLOODS_URL, timeout: float = REQUEST_TIMEOUT,
+                       opener: Callable = urlopen) -> FloodWarningIndex:
+    """
+    Fetch every current flood warning in one request
+    :param url: str - the EA feed, or a local copy (file:// url) to stand in for it
+    :param timeout: float - seconds
+    :param opener: Callable - urlopen, or a stand in such as replay.Cassette.urlopen
+    :return: FloodWarningIndex
+    """
+    with opener(url, timeout=timeout) as response:
+        json_data = json.loads(response.read())
+    return FloodWarningIndex(parse_warning(item) for item in json_data['items'])
+
+
+def get_flood_areas(lat: float, long: float, dist: float = AREA_DIST, *, url: str = FLOOD_AREAS_URL,
+                    timeout: float = REQUEST_TIMEOUT, opener: Callable = urlopen) -> List[str]:
+    """
+    The ids of the flood areas around a point
+    :param lat: float
+    :param long: float
+    :param dist: float - km
+    :param url: str
+    :param timeout: float - seconds
+    :param opener: Callable - urlopen, or a stand in such as replay.Cassette.urlopen
+    :return: List[str]
+    """
+    # pylint: disable=R0913
+    with opener(f"{url}?lat={lat}&long={long}&dist={dist}", timeout=timeout) as response:
+        json_data = json.loads(response.read())
+    return sorted(item['notation'] for item in json_data['items'])
+
+
+class FloodAreaCache:
+    """ the flood areas around each location, looked up from its position the first time it's seen """
+
+    def __init__(self, path: Optional[str] = None, dist: float = AREA_DIST, url: str = FLOOD_AREAS_URL):
+        """
+        :param path: Optional[str] - file to keep the areas in between runs, None to only keep them in memory
+        :param dist: float - km around a location to take flood areas from
+        :param url: str - the EA flood area search
+        """
+        self.path = path
+        self.dist = dist
+        self.url = url
+        self.areas: Dict[str, List[str]] = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as handle:
+                self.areas = json.load(handle)
+
+    def link(self, locations: Iterable[Location], timeout: float = REQUEST_TIMEOUT, opener: Callable = urlopen):
+        """
+        Fill in the flood areas of every location with a position that doesn't list its own. Those not reached in
+        time are left for the next run, and each lookup is saved as it's made so a failure doesn't lose the others
+        :param locations: Iterable[Location]
+        :param timeout: float - seconds for all the lookups together
+        :param opener: Callable - urlopen, or a stand in such as replay.Cassette.urlopen
+        """
+        deadline = time.monotonic() + timeout
+        for location in locations:
+            if location.flood_areas or location.lat is None or location.long is None:
+                continue
+            key = f"{location.lat},{location.long},{self.dist}"
+            if key not in self.areas:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    continue
+                self.areas[key] = get_flood_areas(location.lat, location.long, self.dist, url=self.url,
+                                                   timeout=remaining, opener=opener)
+                if self.path:
+                    self.save()
+            location.flood_areas = self.areas[key]
+
+    def save(self):
+        """ write out the areas looked up so far """
+        with open(self.path, 'w', encoding='utf-8') as handle:
+            json.dump(self.areas, handle, indent=1, sort_keys=True)
@@ -3,23 +3,29 @@ Everything to do with making the api calls to the EA and parsing the result
 """
 import json
 from datetime import datetime
-from typing import Tuple, List
+from typing import Callable, Tuple, List
 from urllib.request import urlopen
 
 from entities import Location
 
 BASE_URL = "https://environment.data.gov.uk/flood-monitoring/id/measures/"
 
+# seconds to wait on a response before giving up - urlopen will otherwise wait forever
+REQUEST_TIMEOUT = 10
 
-def get_data(location: Location, readings: int = 24) -> Tuple[List[int], List[float], datetime]:
+
+def get_data(location: Location, readings: int = 24, timeout: float = REQUEST_TIMEOUT,
+             opener: Callable = urlopen) -> Tuple[List[int], List[float], datetime]:
     """
     Return x and y data
     :param location: Location
     :param readings: int
+    :param timeout: float - seconds
+    :param opener: Callable - urlopen, or a stand in such as replay.Cassette.urlopen
     :return: Tuple[List[int], List[float], datetime] - X in seconds, Y in decimal meters, last sample timestamp
     """
     url = f"{BASE_URL}{location.monitoring_station}-level-stage-i-15_min-m/readings?_sorted&_limit={readings}"
-    with urlopen(url) as response:
+    with opener(url, timeout=timeout) as response:
         raw = response.read()
         json_data = json.loads(raw)
         x_data = [datetime.strptime(reading['dateTime'],
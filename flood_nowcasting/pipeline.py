@@ -0,0 +1,141 @@
+"""
+Deadline aware run pipeline
+Runs fetch -> fit -> timeline lookup -> publish for every location and publishing account concurrently, each location
+moving on as soon as its data arrives. Each blocking stage has its own limit on concurrent requests, and no request is
+allowed to wait past the deadline. Anything not finished by the time limit is cancelled, so one hung request can't stop
+the locations that did finish from being published. A publish is only started if it has time to finish, and once
+started it is seen through - it can't be taken back, so it must be reported and can't be left to go out later. The EA
+flood warnings are only informational, so they're attached to whatever finished and never hold up a location.
+"""
+# pylint: disable=R0912,R0913,R0914,R0915
+import asyncio
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Iterable, Optional, Sequence
+
+from entities import Account, Location
+from status_feed import LocationStatus
+
+# concurrent requests allowed in each stage
+FETCH_LIMIT = 4
+LOOKUP_LIMIT = 2
+PUBLISH_LIMIT = 2
+
+
+async def run_pipeline(nowcaster, locations: Iterable[Location], accounts: Sequence[Account],
+                       time_limit: Optional[float] = None, *, fetch_limit: int = FETCH_LIMIT,
+                       lookup_limit: int = LOOKUP_LIMIT,
+                       publish_limit: int = PUBLISH_LIMIT) -> Dict[str, Dict[str, Optional[LocationStatus]]]:
+    """
+    Process every location for every account, giving up on those that haven't finished within the time limit.
+    Each station is fetched and fitted once however many locations and accounts use it, while each account's
+    published states are looked up in parallel with the fetches.
+    :param nowcaster: FloodNowcasting - provides the fetch, lookup, assess and publish steps
+    :param locations: Iterable[Location]
+    :param accounts: Sequence[Account]
+    :param time_limit: Optional[float] - seconds from now, None to wait for everything
+    :param fetch_limit: int - concurrent EA requests
+    :param lookup_limit: int - concurrent timeline lookups
+    :param publish_limit: int - concurrent publishes
+    :return: Dict[str, Dict[str, Optional[LocationStatus]]] - outcome by account then location name, None if it
+                                                              didn't finish
+    """
+    locations = list(locations)
+    account_locations = {account.name: [location for location in locations if account.covers(location)]
+                         for account in accounts}
+    loop = asyncio.get_running_loop()
+    deadline = math.inf if time_limit is None else loop.time() + time_limit
+    # not the default executor - asyncio.run waits for that to drain, which would wait on a hung request
+    executor = ThreadPoolExecutor(max_workers=fetch_limit + lookup_limit + publish_limit)
+    fetch_slots = asyncio.Semaphore(fetch_limit)
+    lookup_slots = asyncio.Semaphore(lookup_limit)
+    publish_slots = asyncio.Semaphore(publish_limit)
+    # tasks with a publish under way, which are waited for rather than cancelled at the time limit
+    committed = set()
+
+    async def blocking(slots: asyncio.Semaphore, function, *args):
+        async with slots:
+            # a request can't outlive the deadline, the thread making it can't be cancelled
+            timeout = max(0.0, min(nowcaster.timeout, deadline - loop.time()))
+            return await loop.run_in_executor(executor, partial(function, *args, timeout=timeout))
+
+    async def publish(message: str, account: Account):
+        async with publish_slots:
+            if deadline - loop.time() <= nowcaster.publish_timeout:
+                raise TimeoutError(f"less than the {nowcaster.publish_timeout}s publish timeout left")
+            committed.add(asyncio.current_task())
+            await loop.run_in_executor(executor, partial(nowcaster.publish, message, account,
+                                                         timeout=nowcaster.publish_timeout))
+
+    async def forecast(station: str):
+        x_values, y_values, latest_timestamp = await asyncio.shield(fetches[station])
+        return y_values[-1], nowcaster.forecast(station_locations[station], x_values, y_values), latest_timestamp
+
+    async def process(account: Account, location: Location) -> LocationStatus:
+        current_level, station_forecasts, latest_timestamp = \
+            await asyncio.shield(forecasts[location.monitoring_station])
+        forecast_levels, forecast_upper = station_forecasts[location.name]
+        current_output_state = (await asyncio.shield(lookups[account.name]))[location.name]
+        new_state = nowcaster.assess(location, current_level, forecast_levels, forecast_upper, current_output_state)
+        if new_state != current_output_state:  # publicise change:
+            await publish(location.get_message(new_state) + nowcaster.message_suffix(latest_timestamp), account)
+        # the warnings are only informational, so they're attached after the run rather than waited for here
+        return LocationStatus(location, new_state, current_level, forecast_levels, latest_timestamp)
+
+    # shared work - one request and one fit per station, one request for the warnings, one lookup per account
+    station_locations = {}
+    for location in locations:
+        station_locations.setdefault(location.monitoring_station, []).append(location)
+    fetches = {station: asyncio.ensure_future(blocking(fetch_slots, nowcaster.fetch, station_location[0]))
+               for station, station_location in station_locations.items()}
+    flood_warnings = asyncio.ensure_future(blocking(fetch_slots, nowcaster.fetch_flood_warnings, locations))
+    forecasts = {station: asyncio.ensure_future(forecast(station)) for station in station_locations}
+    lookups = {account.name: asyncio.ensure_future(
+        blocking(lookup_slots, nowcaster.get_current_output_states, account_locations[account.name],
+                 nowcaster.suffix_length(), account)) for account in accounts}
+    shared = list(fetches.values()) + [flood_warnings] + list(forecasts.values()) + list(lookups.values())
+
+    tasks = {asyncio.ensure_future(process(account, location)): (account, location)
+             for account in accounts for location in account_locations[account.name]}
+    try:
+        pending = set()
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=time_limit)
+        for task in pending - committed:
+            task.cancel()
+        # a publish only starts with its timeout to spare and is the last step, so these finish within the time limit
+        if pending & committed:
+            await asyncio.wait(pending & committed)
+        if not flood_warnings.done():
+            await asyncio.wait([flood_warnings], timeout=None if time_limit is None else
+                               max(0.0, deadline - loop.time()))
+        for task in shared:
+            task.cancel()
+        await asyncio.gather(*pending, *shared, return_exceptions=True)
+    finally:
+        executor.shutdown(wait=False)
+
+    warning_index = None
+    if flood_warnings.cancelled():
+        logging.warning("flood warnings abandoned at the %ss time limit", time_limit)
+    elif flood_warnings.exception() is not None:
+        logging.warning("couldn't load flood warnings: %s", flood_warnings.exception())
+    else:
+        warning_index = flood_warnings.result()
+
+    results = {account.name: {} for account in accounts}
+    for task, (account, location) in tasks.items():
+        results[account.name][location.name] = None
+        if task.cancelled():
+            logging.warning("%s station %s abandoned at the %ss time limit", account.name, location.name, time_limit)
+        elif isinstance(task.exception(), TimeoutError):
+            # an error, not a warning - a state change that never goes out is what this is all for
+            logging.error("%s station %s not published: %s", account.name, location.name, task.exception())
+        elif task.exception() is not None:
+            logging.error("%s station %s failed", account.name, location.name, exc_info=task.exception())
+        else:
+            results[account.name][location.name] = task.result()._replace(
+                warnings=nowcaster.check_flood_warnings(location, warning_index))
+    return results
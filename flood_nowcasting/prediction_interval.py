@@ -0,0 +1,91 @@
+"""
+Prediction intervals for the nowcast
+Quantifies how far the quadratic fit could be out at each horizon so centimetre noise in the readings doesn't flip the
+published state. Everything is vectorised across series (eg stations), coverages (eg locations) and bootstrap resamples.
+"""
+# pylint: disable=R0913,R0914
+from statistics import NormalDist
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+ANALYTIC = "analytic"
+BOOTSTRAP = "bootstrap"
+
+# quadratic fit, as the nowcast
+DEGREE = 2
+
+# x is rebased seconds - work in hours so the normal equations are well conditioned
+SCALE = 3600.0
+
+
+def _t_quantile(probability: float, dof: int) -> float:
+    """
+    Student's t quantile via the Cornish-Fisher expansion of the normal quantile, saves pulling in scipy
+    :param probability: float
+    :param dof: int - degrees of freedom
+    :return: float
+    """
+    z_value = NormalDist().inv_cdf(probability)
+    return z_value + (z_value ** 3 + z_value) / (4 * dof) + \
+        (5 * z_value ** 5 + 16 * z_value ** 3 + 3 * z_value) / (96 * dof ** 2)
+
+
+def forecast_interval(x_values: Sequence[float], y_values, horizons: Sequence[int],
+                      confidence: Union[float, Sequence[float]], *, method: str = ANALYTIC, resamples: int = 1000,
+                      seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Forecast with a central prediction interval at each horizon
+    :param x_values: Sequence[float] - seconds, shared by every series
+    :param y_values: (n,) for one series or (k, n) to do k series sharing x_values at once
+    :param horizons: Sequence[int] - seconds after the last reading to forecast
+    :param confidence: float - coverage of the interval eg 0.8 for the 10th to 90th percentile, or a sequence of c
+                       coverages to get the bounds for each (eg every location on a station) from the one fit
+    :param method: str - ANALYTIC for least squares variance or BOOTSTRAP to resample the residuals
+    :param resamples: int - bootstrap resamples
+    :param seed: Optional[int] - seed the bootstrap for repeatable output
+    :return: Tuple[ndarray, ndarray, ndarray] - forecast (h,) or (k, h), lower and upper bounds the same shape, or
+                                                with a leading (c,) axis given a sequence of coverages
+    """
+    x_array = np.asarray(x_values, dtype=float) / SCALE
+    y_array = np.asarray(y_values, dtype=float)
+    single = y_array.ndim == 1
+    y_array = np.atleast_2d(y_array).T  # (n, k)
+    samples = len(x_array)
+    dof = samples - (DEGREE + 1)
+    if dof < 1:
+        raise ValueError(f"Need more than {DEGREE + 1} readings for a prediction interval")
+
+    design = np.vander(x_array, DEGREE + 1, increasing=True)  # (n, 3)
+    targets = np.vander(x_array[-1] + np.asarray(horizons, dtype=float) / SCALE, DEGREE + 1, increasing=True)
+    pseudo_inverse = np.linalg.pinv(design)  # (3, n)
+    coefficients = pseudo_inverse @ y_array  # (3, k)
+    forecast = targets @ coefficients  # (h, k)
+    residuals = y_array - design @ coefficients  # (n, k)
+    upper_probability = (1 + np.atleast_1d(np.asarray(confidence, dtype=float))) / 2  # (c,)
+
+    if method == ANALYTIC:
+        variance = (residuals ** 2).sum(axis=0) / dof  # (k,)
+        leverage = np.einsum('hi,ij,hj->h', targets, np.linalg.pinv(design.T @ design), targets)  # (h,)
+        quantiles = np.array([_t_quantile(probability, dof) for probability in upper_probability])  # (c,)
+        spread = quantiles[:, None, None] * np.sqrt(np.outer(1 + leverage, variance))  # (c, h, k)
+        lower, upper = forecast - spread, forecast + spread
+    elif method == BOOTSTRAP:
+        generator = np.random.default_rng(seed)
+        # rescale so the resampled residuals have the variance of the errors rather than of the fit
+        residuals = residuals * np.sqrt(samples / dof)
+        resampled = residuals[generator.integers(0, samples, size=(resamples, samples))]  # (B, n, k)
+        refits = pseudo_inverse @ (design @ coefficients + resampled)  # (B, 3, k)
+        noise = residuals[generator.integers(0, samples, size=(resamples, len(targets)))]  # (B, h, k)
+        simulated = targets @ refits + noise  # (B, h, k)
+        bounds = np.quantile(simulated, np.concatenate([1 - upper_probability, upper_probability]), axis=0)
+        lower, upper = bounds[:len(upper_probability)], bounds[len(upper_probability):]  # (c, h, k)
+    else:
+        raise ValueError(f"Unknown prediction interval method {method}")
+
+    forecast, lower, upper = forecast.T, np.swapaxes(lower, 1, 2), np.swapaxes(upper, 1, 2)  # (k, h), (c, k, h)
+    if single:
+        forecast, lower, upper = forecast[0], lower[:, 0], upper[:, 0]
+    if np.ndim(confidence) == 0:
+        lower, upper = lower[0], upper[0]
+    return forecast, lower, upper
@@ -0,0 +1,141 @@
+"""
+Record / replay
+Captures the EA responses, twitter timelines and published messages of a real run into a compact fixture file, then
+plays them back from disk with no network - at full speed, or with the original timing - so whole runs are
+deterministic for regression tests and performance comparisons.
+"""
+import gzip
+import json
+import threading
+import time
+from collections import deque
+from io import BytesIO
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.request import urlopen
+
+URL = "url"
+TIMELINE = "timeline"
+PUBLISH = "publish"
+
+
+class Cassette:
+    """ the recorded I/O of a run """
+
+    def __init__(self, path: str, record: bool = False, realtime: bool = False):
+        """
+        :param path: str - fixture file, gzipped if it ends .gz
+        :param record: bool - make real requests and keep them, rather than play back the file
+        :param realtime: bool - when playing back, take as long as the original requests did
+        """
+        self.path = path
+        self.record = record
+        self.realtime = realtime
+        self.interactions: List[dict] = []
+        self.published: List[Tuple[str, str]] = []
+        self._replay: Dict[Tuple[str, str], Deque[dict]] = {}
+        self._lock = threading.Lock()
+        if not record:
+            with self._open('rt') as handle:
+                self.interactions = json.load(handle)['interactions']
+            for interaction in self.interactions:
+                self._replay.setdefault((interaction['kind'], interaction['key']), deque()).append(interaction)
+
+    def _open(self, mode: str):
+        if self.path.endswith('.gz'):
+            return gzip.open(self.path, mode, encoding='utf-8')
+        return open(self.path, mode, encoding='utf-8')
+
+    def save(self):
+        """ write out what was recorded """
+        with self._open('wt') as handle:
+            json.dump({'interactions': self.interactions}, handle, separators=(',', ':'))
+
+    def _keep(self, interaction: dict):
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def _next(self, kind: str, key: str) -> dict:
+        with self._lock:
+            recorded = self._replay.get((kind, key))
+            if not recorded:
+                raise LookupError(f"no recording of {kind} {key} in {self.path}")
+            interaction = recorded.popleft()
+        if self.realtime:
+            time.sleep(interaction['elapsed'])
+        return interaction
+
+    def urlopen(self, url: str, timeout: Optional[float] = None):
+        """
+        Stand in for urllib's urlopen
+        :param url: str
+        :param timeout: Optional[float] - seconds
+        :return: a file like response
+        """
+        if not self.record:
+            body = self._next(URL, url)['body']
+            # json is kept as json rather than an escaped string, it's smaller
+            if 'json' in body:
+                return BytesIO(json.dumps(body['json'], separators=(',', ':')).encode('utf-8'))
+            return BytesIO(body['text'].encode('utf-8'))
+        start = time.monotonic()
+        with urlopen(url, timeout=timeout) as response:
+            raw = response.read()
+        try:
+            body = {'json': json.loads(raw)}
+        except ValueError:
+            body = {'text': raw.decode('utf-8')}
+        self._keep({'kind': URL, 'key': url, 'elapsed': time.monotonic() - start, 'body': body})
+        return BytesIO(raw)
+
+    def pages(self, key: str, pages: Callable[[], Iterable[List[str]]]) -> Iterator[List[str]]:
+        """
+        Stand in for paging through a timeline, recording only the pages actually read
+        :param key: str - eg the user id
+        :param pages: Callable[[], Iterable[List[str]]] - the real request, only called when recording
+        :return: Iterator[List[str]] - tweet texts, page by page
+        """
+        if not self.record:
+            yield from self._next(TIMELINE, key)['pages']
+            return
+        interaction = {'kind': TIMELINE, 'key': key, 'elapsed': 0.0, 'pages': []}
+        self._keep(interaction)
+        start = time.monotonic()
+        for page in pages():
+            interaction['pages'].append(page)
+            interaction['elapsed'] = time.monotonic() - start
+            yield page
+
+    def publish(self, key: str, message: str, send: Callable[[], None]):
+        """
+        Stand in for publishing, which is only really sent when recording
+        :param key: str - eg the user id
+        :param message: str
+        :param send: Callable[[], None] - the real request
+        """
+        with self._lock:
+            self.published.append((key, message))
+        if not self.record:
+            if self.realtime:
+                time.sleep(self.recorded_publish_time(key))
+            return
+        start = time.monotonic()
+        send()
+        self._keep({'kind': PUBLISH, 'key': key, 'elapsed': time.monotonic() - start, 'message': message})
+
+    def recorded_publish_time(self, key: str) -> float:
+        """
+        Mean time a publish took when recording, so a replay with different messages can still take as long
+        :param key: str
+        :return: float - seconds
+        """
+        times = [interaction['elapsed'] for interaction in self.interactions
+                 if interaction['kind'] == PUBLISH and interaction['key'] == key]
+        return sum(times) / len(times) if times else 0.0
+
+    def recorded_published(self) -> List[Tuple[str, str]]:
+        """
+        What the recorded run published, to compare a replay against
+        :return: List[Tuple[str, str]] - key and message
+        """
+        return [(interaction['key'], interaction['message']) for interaction in self.interactions
+                if interaction['kind'] == PUBLISH]
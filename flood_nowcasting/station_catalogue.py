@@ -0,0 +1,271 @@
+"""
+EA station catalogue
+Downloads the level gauges from the EA /id/stations catalogue once, caches them locally and indexes them on a grid so a
+Location can be set up from coordinates instead of looking up the monitoring station by hand
+"""
+# pylint: disable=R0914
+import argparse
+import gzip
+import json
+import math
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from load_ea_data import REQUEST_TIMEOUT
+
+STATIONS_URL = "https://environment.data.gov.uk/flood-monitoring/id/stations?parameter=level&_limit=10000"
+
+CACHE_PATH = "stations.json.gz"
+
+# grid cell size in degrees - a few km, a handful of gauges per cell
+CELL_SIZE = 0.05
+
+# a river with no more gauges than this is quicker to check gauge by gauge than to walk the cells out to them
+BRUTE_FORCE_LIMIT = 32
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+FIELDS = ("reference", "label", "river", "lat", "long")
+
+
+class Station(NamedTuple):
+    """ the parts of a catalogue entry needed to choose a monitoring station """
+    reference: str
+    label: str
+    river: Optional[str]
+    lat: float
+    long: float
+
+
+class Grid(NamedTuple):
+    """ stations bucketed by grid cell """
+    cells: Dict[Tuple[int, int], List[Station]]
+    bounds: Tuple[int, int, int, int]  # of the occupied cells - min row, max row, min column, max column
+    stations: List[Station]
+
+
+def distance_km(lat_a: float, long_a: float, lat_b: float, long_b: float) -> float:
+    """
+    Great circle distance
+    :return: float - km
+    """
+    lat_a, long_a, lat_b, long_b = map(math.radians, (lat_a, long_a, lat_b, long_b))
+    chord = math.sin((lat_b - lat_a) / 2) ** 2 + \
+        math.cos(lat_a) * math.cos(lat_b) * math.sin((long_b - long_a) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(chord))
+
+
+def parse_station(item: dict) -> Optional[Station]:
+    """
+    Convert an item from the EA api, skipping those with no location
+    :param item: dict
+    :return: Optional[Station]
+    """
+    lat, long = item.get('lat'), item.get('long')
+    if lat is None or long is None or 'stationReference' not in item:
+        return None
+    # a few stations have been moved and list every position they've had
+    if isinstance(lat, list):
+        lat, long = lat[-1], long[-1]
+    label = item.get('label', '')
+    if isinstance(label, list):
+        label = label[-1]
+    return Station(item['stationReference'], label, item.get('riverName'), float(lat), float(long))
+
+
+def fetch_stations(url: str, etag: Optional[str] = None,
+                   timeout: float = REQUEST_TIMEOUT) -> Tuple[Optional[List[Station]], Optional[str]]:
+    """
+    Download stations, conditional on the catalogue having changed
+    :param url: str
+    :param etag: Optional[str] - from the last download
+    :param timeout: float - seconds
+    :return: Tuple[Optional[List[Station]], Optional[str]] - stations (None if not modified) and the new etag
+    """
+    request = Request(url, headers={'If-None-Match': etag} if etag else {})
+    try:
+        with urlopen(request, timeout=timeout) as response:
+            json_data = json.loads(response.read())
+            new_etag = response.headers.get('ETag')
+    except HTTPError as error:
+        if error.code == 304:  # not modified
+            return None, etag
+        raise
+    stations = [parse_station(item) for item in json_data['items']]
+    return [station for station in stations if station is not None], new_etag
+
+
+class StationCatalogue:
+    """ level gauges indexed by position """
+
+    def __init__(self, stations: Iterable[Station], etag: Optional[str] = None):
+        """
+        :param stations: Iterable[Station]
+        :param etag: Optional[str] - of the download the stations came from
+        """
+        self.stations: Dict[str, Station] = {station.reference: station for station in stations}
+        self.etag = etag
+        self._build_index()
+
+    def _build_index(self):
+        """ bucket every station into its grid cell, in one grid of them all and one per river """
+        by_river: Dict[str, List[Station]] = {}
+        for station in self.stations.values():
+            if station.river:
+                by_river.setdefault(station.river, []).append(station)
+        self._grids: Dict[Optional[str], Grid] = {river: self._grid(stations) for river, stations in by_river.items()}
+        self._grids[None] = self._grid(list(self.stations.values()))
+
+    @classmethod
+    def _grid(cls, stations: List[Station]) -> Grid:
+        cells: Dict[Tuple[int, int], List[Station]] = {}
+        for station in stations:
+            cells.setdefault(cls._cell(station.lat, station.long), []).append(station)
+        rows = [cell[0] for cell in cells] or [0]
+        columns = [cell[1] for cell in cells] or [0]
+        return Grid(cells, (min(rows), max(rows), min(columns), max(columns)), stations)
+
+    @staticmethod
+    def _cell(lat: float, long: float) -> Tuple[int, int]:
+        return math.floor(lat / CELL_SIZE), math.floor(long / CELL_SIZE)
+
+    def nearest(self, lat: float, long: float, count: int = 1,
+                river: Optional[str] = None) -> List[Tuple[Station, float]]:
+        """
+        Find the closest gauges to a point, searching outwards ring by ring of grid cells
+        :param lat: float
+        :param long: float
+        :param count: int - how many to return
+        :param river: Optional[str] - only consider gauges on this river, eg to find those upstream of a location
+        :return: List[Tuple[Station, float]] - closest first, with distance in km
+        """
+        grid = self._grids.get(river)
+        if grid is None or not grid.stations:
+            return []
+        row, column = self._cell(lat, long)
+        min_row, max_row, min_column, max_column = grid.bounds
+        last_radius = max(row - min_row, max_row - row, column - min_column, max_column - column)
+        if len(grid.stations) <= BRUTE_FORCE_LIMIT:
+            found = [(station, distance_km(lat, long, station.lat, station.long)) for station in grid.stations]
+            return sorted(found, key=lambda pair: pair[1])[:count]
+        found = []
+        for radius in range(last_radius + 1):
+            for cell in self._ring(row, column, radius):
+                for station in grid.cells.get(cell, ()):
+                    found.append((station, distance_km(lat, long, station.lat, station.long)))
+            found.sort(key=lambda pair: pair[1])
+            # anything outside the rings searched so far is at least radius cells away
+            cos_lat = math.cos(math.radians(min(abs(lat) + (radius + 1) * CELL_SIZE, 90)))
+            if len(found) >= count and found[count - 1][1] <= radius * CELL_SIZE * KM_PER_DEGREE * cos_lat:
+                break
+        return found[:count]
+
+    @staticmethod
+    def _ring(row: int, column: int, radius: int) -> Iterable[Tuple[int, int]]:
+        """ the cells exactly radius cells away from the centre """
+        if radius == 0:
+            yield row, column
+            return
+        for offset in range(-radius, radius + 1):
+            yield row - radius, column + offset
+            yield row + radius, column + offset
+        for offset in range(-radius + 1, radius):
+            yield row + offset, column - radius
+            yield row + offset, column + radius
+
+    def merge(self, stations: Iterable[Station], lat: Optional[float] = None, long: Optional[float] = None,
+              dist: Optional[float] = None):
+        """
+        Update from a fresh download. Given an area, anything in the area that wasn't in the download has closed
+        and is removed; otherwise the download is taken to be the whole catalogue.
+        :param stations: Iterable[Station]
+        :param lat: Optional[float]
+        :param long: Optional[float]
+        :param dist: Optional[float] - km
+        """
+        stations = {station.reference: station for station in stations}
+        if dist is None:
+            self.stations = stations
+        else:
+            for reference, station in list(self.stations.items()):
+                if reference not in stations and distance_km(lat, long, station.lat, station.long) <= dist:
+                    del self.stations[reference]
+            self.stations.update(stations)
+        self._build_index()
+
+    def refresh(self, url: str = STATIONS_URL, lat: Optional[float] = None, long: Optional[float] = None,
+                dist: Optional[float] = None) -> bool:
+        """
+        Bring the catalogue up to date - only the stations within dist km of a point if given, otherwise the whole
+        catalogue if it has changed since the last download
+        :param url: str
+        :param lat: Optional[float]
+        :param long: Optional[float]
+        :param dist: Optional[float] - km
+        :return: bool - whether anything was downloaded
+        """
+        if dist is not None:
+            stations, _ = fetch_stations(f"{url}&lat={lat}&long={long}&dist={dist}")
+        else:
+            stations, self.etag = fetch_stations(url, self.etag)
+        if stations is None:
+            return False
+        self.merge(stations, lat, long, dist)
+        return True
+
+    def save(self, path: str = CACHE_PATH):
+        """
+        Write the catalogue as gzipped columns
+        :param path: str
+        """
+        columns = {field: [getattr(station, field) for station in self.stations.values()] for field in FIELDS}
+        with gzip.open(path, 'wt', encoding='utf-8') as handle:
+            json.dump({'etag': self.etag, 'columns': columns}, handle, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path: str = CACHE_PATH) -> 'StationCatalogue':
+        """
+        Read a cached catalogue, empty if there isn't one yet
+        :param path: str
+        :return: StationCatalogue
+        """
+        if not os.path.exists(path):
+            return cls([])
+        with gzip.open(path, 'rt', encoding='utf-8') as handle:
+            cached = json.load(handle)
+        columns = cached['columns']
+        return cls((Station(*row) for row in zip(*(columns[field] for field in FIELDS))), cached['etag'])
+
+
+def args():
+    """
+    Generate args for app
+    :return: dictionary of arguments
+    """
+    parser = argparse.ArgumentParser("Find EA level gauges for a location")
+    parser.add_argument("command", choices=["refresh", "nearest"])
+    parser.add_argument("--cache", type=str, default=CACHE_PATH, help="catalogue cache file")
+    parser.add_argument("--lat", type=float, help="latitude of the location")
+    parser.add_argument("--long", type=float, help="longitude of the location")
+    parser.add_argument("--dist", type=float, default=None, help="refresh only the gauges within this many km")
+    parser.add_argument("--count", type=int, default=5, help="number of gauges to list")
+    parser.add_argument("--river", type=str, default=None, help="only list gauges on this river")
+    parsed = parser.parse_args()
+    if (parsed.command == "nearest" or parsed.dist is not None) and (parsed.lat is None or parsed.long is None):
+        parser.error("--lat and --long are required to find the nearest gauges or refresh an area")
+    return parsed
+
+
+if __name__ == '__main__':
+    args = args()
+    catalogue = StationCatalogue.load(args.cache)
+    if args.command == "refresh" or not catalogue.stations:
+        if catalogue.refresh(lat=args.lat, long=args.long, dist=args.dist):
+            catalogue.save(args.cache)
+        print(f"{len(catalogue.stations)} stations cached in {args.cache}")
+    if args.command == "nearest":
+        for gauge, distance in catalogue.nearest(args.lat, args.long, args.count, args.river):
+            print(f"{gauge.reference:<10} {distance:6.2f} km  {gauge.label} ({gauge.river or 'no river'})")
@@ -0,0 +1,145 @@
+"""
+Static status feed
+Writes the state of every location as static JSON and GeoJSON files that can be served from a CDN or any file server,
+so readers don't need to poll us or twitter. Each location is its own shard, content hashed, and a file is only
+rewritten when its content changes; index.json lists every shard with its hash for readers to poll cheaply.
+"""
+# pylint: disable=R0914
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+from entities import FloodStates, Location
+from flood_warnings import FloodWarning
+
+INDEX_FILE = "index.json"
+GEOJSON_FILE = "status.geojson"
+SHARD_DIRECTORY = "locations"
+
+
+class LocationStatus(NamedTuple):
+    """ the outcome of a run for one location """
+    location: Location
+    state: FloodStates
+    level: float
+    forecast: Sequence[float]
+    data_timestamp: datetime
+    warnings: Sequence[FloodWarning] = ()
+
+
+def slug(name: str) -> str:
+    """
+    File name safe version of a location name
+    :param name: str
+    :return: str
+    """
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+
+
+def to_entry(status: LocationStatus) -> dict:
+    """
+    The feed entry for a location
+    :param status: LocationStatus
+    :return: dict
+    """
+    return {
+        'name': status.location.name,
+        'monitoring_station': status.location.monitoring_station,
+        'lat': status.location.lat,
+        'long': status.location.long,
+        'state': status.state.name,
+        'message': status.location.get_message(status.state),
+        'level': round(float(status.level), 3),
+        'forecast': [round(float(level), 3) for level in status.forecast],
+        'warn': status.location.warn,
+        'wet': status.location.wet,
+        'data_timestamp': status.data_timestamp.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'flood_warnings': [{'area_id': warning.area_id, 'description': warning.description,
+                            'severity': warning.severity} for warning in status.warnings]
+    }
+
+
+def _serialise(content) -> bytes:
+    """ stable serialisation so unchanged content hashes the same """
+    return json.dumps(content, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def _etag(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()[:16]
+
+
+def _write(path: str, content: bytes):
+    """ write then rename, so a reader never sees a half written file """
+    temporary = f"{path}.tmp"
+    with open(temporary, 'wb') as handle:
+        handle.write(content)
+    os.replace(temporary, path)
+
+
+def _read_json(path: str, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def _remove_unconfigured(directory: str, index: Dict[str, dict], configured: Iterable[str]) -> List[str]:
+    """ drop the shards of locations no longer configured, so they don't stay in the feed with their last state """
+    keep = {slug(name) for name in configured}
+    removed = []
+    for key in [key for key in index if key not in keep]:
+        path = os.path.join(directory, index.pop(key)['href'])
+        if os.path.exists(path):
+            os.remove(path)
+        removed.append(path)
+    return removed
+
+
+def write_status_feed(directory: str, statuses: Iterable[LocationStatus],
+                      configured: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Bring the feed up to date. Configured locations missing from statuses (eg abandoned at the time limit) keep their
+    last entry, those no longer configured are removed.
+    :param directory: str
+    :param statuses: Iterable[LocationStatus]
+    :param configured: Optional[Iterable[str]] - names of every location the feed covers, None to keep everything
+    :return: List[str] - the files that were rewritten or removed
+    """
+    os.makedirs(os.path.join(directory, SHARD_DIRECTORY), exist_ok=True)
+    index_path = os.path.join(directory, INDEX_FILE)
+    index: Dict[str, dict] = _read_json(index_path, {'locations': {}})['locations']
+    written = [] if configured is None else _remove_unconfigured(directory, index, configured)
+
+    for status in statuses:
+        key = slug(status.location.name)
+        content = _serialise(to_entry(status))
+        etag = _etag(content)
+        href = f"{SHARD_DIRECTORY}/{key}.json"
+        path = os.path.join(directory, href)
+        if index.get(key, {}).get('etag') == etag and os.path.exists(path):
+            continue
+        _write(path, content)
+        written.append(path)
+        index[key] = {'name': status.location.name, 'state': status.state.name, 'href': href, 'etag': etag}
+
+    if written or not os.path.exists(index_path):
+        features = []
+        for key in sorted(index):
+            entry = _read_json(os.path.join(directory, index[key]['href']), None)
+            if entry is None or entry['lat'] is None or entry['long'] is None:
+                continue
+            features.append({
+                'type': 'Feature',
+                'id': key,
+                'geometry': {'type': 'Point', 'coordinates': [entry['long'], entry['lat']]},
+                'properties': entry
+            })
+        geojson_path = os.path.join(directory, GEOJSON_FILE)
+        geojson = _serialise({'type': 'FeatureCollection', 'features': features})
+        _write(geojson_path, geojson)
+        _write(index_path, _serialise({'locations': index, 'geojson': {'href': GEOJSON_FILE, 'etag': _etag(geojson)}}))
+        written += [geojson_path, index_path]
+    return written
@@ -5,7 +5,11 @@ import sys
 # bugger about with the path to include the package. not the right way really.
 sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/flood_nowcasting")
 
-from flood_nowcasting.flood_nowcasting import FloodNowcasting
+from flood_nowcasting.entities import Account
+from flood_nowcasting.flood_nowcasting import FloodNowcasting, PUBLISH_TIMEOUT
+
+# seconds kept back from the lambda timeout to report back in
+DEADLINE_MARGIN = 5
 
 
 # import sys
@@ -16,15 +20,27 @@ from flood_nowcasting.flood_nowcasting import FloodNowcasting
 
 def lambda_handler(event, context):
     try:
+        # further accounts as a json list of Account arguments
+        accounts = [Account(**account) for account in json.loads(os.environ.get('ACCOUNTS', '[]'))]
         nowcast = FloodNowcasting(app_key=os.environ['APP_KEY'],
                                   app_secret=os.environ['APP_SECRET'],
                                   access_token=os.environ['ACCESS_TOKEN'],
-                                  access_token_secret=os.environ['ACCESS_TOKEN_SECRET'])
-        nowcast.main()
+                                  access_token_secret=os.environ['ACCESS_TOKEN_SECRET'],
+                                  status_dir=os.environ.get('STATUS_DIR'),
+                                  # only /tmp is writable, and it lasts while the lambda stays warm
+                                  areas_cache=os.environ.get('AREAS_CACHE', '/tmp/flood_areas.json'),
+                                  accounts=accounts,
+                                  publish_timeout=float(os.environ.get('PUBLISH_TIMEOUT', PUBLISH_TIMEOUT)))
+        results = nowcast.run(context.get_remaining_time_in_millis() / 1000 - DEADLINE_MARGIN)
 
         return {
             'statusCode': 200,
-            'body': json.dumps('Run complete')
+            'body': json.dumps({
+                account: {
+                    'completed': {name: status.state.name for name, status in statuses.items() if status is not None},
+                    'incomplete': [name for name, status in statuses.items() if status is None]
+                } for account, statuses in results.items()
+            })
         }
     except Exception:
 
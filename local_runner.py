@@ -2,7 +2,9 @@ import logging
 
 import yaml
 
+from flood_nowcasting.entities import Account
 from flood_nowcasting.flood_nowcasting import FloodNowcasting
+from flood_nowcasting.flood_warnings import AREAS_CACHE_PATH
 
 logging.basicConfig(filename='run.log', level=logging.INFO,
                     format='%(asctime)s %(message)s',
@@ -22,6 +24,8 @@ if __name__ == '__main__':
                               app_secret=config['APP_SECRET'],
                               access_token=config['ACCESS_TOKEN'],
                               access_token_secret=config[
-                                  'ACCESS_TOKEN_SECRET'])
+                                  'ACCESS_TOKEN_SECRET'],
+                              accounts=[Account(**account) for account in config.get('ACCOUNTS', [])],
+                              areas_cache=AREAS_CACHE_PATH)
     nowcast.main()
     logging.info("run complete")
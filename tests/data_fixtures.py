@@ -3,7 +3,7 @@ from typing import Tuple, List
 from numpy import full
 from numpy import array as np_array
 
-from entities import FloodStates
+from entities import FloodStates, Location
 
 EXE_SAMPLE_Y = [3.87, 3.875, 3.88, 3.879, 3.884, 3.887, 3.891, 3.891, 3.895, 3.895, 3.899, 3.899, 3.907, 3.909, 3.907,
                 3.909, 3.909, 3.909, 3.909, 3.91, 3.906, 3.909, 3.906, 3.905, 3.899, 3.899, 3.896, 3.891, 3.887, 3.888,
@@ -100,6 +100,19 @@ EXE_SAMPLE_OUTCOME = [{'state': FloodStates.WET, 'forecast': [3.90380368, 3.9003
                       {'state': FloodStates.WET, 'forecast': [3.93835208, 3.92729931]}]
 
 
+def make_location(name: str = "test", monitoring_station: str = "45128", wet: float = 3.86, warn: float = 3.84,
+                  **kwargs) -> Location:
+    """ a location with a message per state naming it, any other Location arguments passed through """
+    return Location(
+        name=name,
+        monitoring_station=monitoring_station,
+        wet=wet,
+        warn=warn,
+        messages={state: f"{name} {state.name}" for state in FloodStates},
+        **kwargs
+    )
+
+
 def get_flat() -> Tuple[List[int], List[float]]:
     x = [step * 15 * 60 for step in range(0, 24)]
     y = list(full(24, 5.00))
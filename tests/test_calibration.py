@@ -0,0 +1,74 @@
+import unittest
+
+from calibration import CandidateScore, calibrate, forecast_series, frange, rank, replay_states, score
+from entities import FloodStates
+from tests.data_fixtures import EXE_SAMPLE_X, EXE_SAMPLE_Y, EXE_SAMPLE_OUTCOME
+
+
+class TestCalibration(unittest.TestCase):
+
+    def test_forecast_series_matches_nowcast(self):
+        steps = forecast_series(EXE_SAMPLE_X, EXE_SAMPLE_Y, 24)
+        self.assertEqual(len(EXE_SAMPLE_X) - 23, len(steps))
+        for i, (time, current_level, forecast) in enumerate(steps[:len(EXE_SAMPLE_OUTCOME)]):
+            self.assertEqual(EXE_SAMPLE_X[i + 23], time)
+            self.assertEqual(EXE_SAMPLE_Y[i + 23], current_level)
+            self.assertAlmostEqual(EXE_SAMPLE_OUTCOME[i]['forecast'][0], forecast[0], delta=0.01)
+            self.assertAlmostEqual(EXE_SAMPLE_OUTCOME[i]['forecast'][1], forecast[1], delta=0.01)
+
+    def test_score(self):
+        times = [0, 900, 1800, 2700, 3600, 4500, 5400]
+        states = [FloodStates.DRY, FloodStates.WARN, FloodStates.WET, FloodStates.CARE, FloodStates.DRY,
+                  FloodStates.WARN, FloodStates.DRY]
+        # one flood starting 1800, warned 900 ahead; the second alert is a false alarm
+        hit_rate, false_alarms, false_alarm_hours, lead, churn = score(times, states, [(1800, 2700)], 3600)
+        self.assertEqual(1.0, hit_rate)
+        self.assertEqual(1, false_alarms)
+        # alerting for 15 minutes after the flood, and the 15 minute false alarm
+        self.assertEqual(0.5, false_alarm_hours)
+        self.assertEqual(15, lead)
+        self.assertEqual(6, churn)
+        # lead capped at max_lead
+        self.assertEqual(10, score(times, states, [(1800, 2700)], 600)[3])
+        # a flood nothing alerted for
+        hit_rate, false_alarms, false_alarm_hours, lead, _ = score(times, states, [(9000, 9900)], 900)
+        self.assertEqual(0.0, hit_rate)
+        self.assertEqual(2, false_alarms)
+        self.assertEqual(1.0, false_alarm_hours)
+        self.assertIsNone(lead)
+
+    def test_calibrate(self):
+        series = (EXE_SAMPLE_X, EXE_SAMPLE_Y)
+        intervals = [(EXE_SAMPLE_X[60], EXE_SAMPLE_X[80])]
+        results = calibrate(series, intervals, frange(3.8, 3.9, 0.05), frange(3.85, 3.95, 0.05), workers=2)
+        # warn above wet is skipped
+        self.assertEqual(8, len(results))
+        self.assertEqual(1.0, results[0].hit_rate)
+        steps = forecast_series(EXE_SAMPLE_X, EXE_SAMPLE_Y, 24)
+        states = replay_states(steps, results[0].warn, results[0].wet)
+        self.assertEqual(score([step[0] for step in steps], states, intervals, 3 * 3600)[1],
+                         results[0].false_alarms)
+
+    def test_always_alerting_loses(self):
+        series = (EXE_SAMPLE_X, EXE_SAMPLE_Y)
+        intervals = [(EXE_SAMPLE_X[60], EXE_SAMPLE_X[80])]
+        results = calibrate(series, intervals, [3.0, 3.84, 3.88], [3.0, 3.86, 3.9], workers=2)
+        # warn and wet of 3m is WET from start to end - it catches the flood but shouldn't win
+        self.assertNotEqual((3.0, 3.0), (results[0].warn, results[0].wet))
+        always = [result for result in results if (result.warn, result.wet) == (3.0, 3.0)][0]
+        self.assertEqual(180, always.mean_lead_minutes)
+        self.assertGreater(always.false_alarm_hours, results[0].false_alarm_hours)
+
+    def test_rank(self):
+        # equal hit rate and false alarms - alerting on time beats alerting late, which beats never alerting
+        on_time = CandidateScore(3.8, 3.9, 24, (1800, 3600), 1.0, 0, 0.0, 0.0, 4)
+        late = CandidateScore(3.85, 3.9, 24, (1800, 3600), 1.0, 0, 0.0, -30.0, 2)
+        never = CandidateScore(3.9, 3.9, 24, (1800, 3600), 1.0, 0, 0.0, None, 0)
+        self.assertEqual([on_time, late, never], sorted([never, late, on_time], key=rank))
+
+    def test_frange(self):
+        self.assertEqual([3.8, 3.82, 3.84], frange(3.8, 3.84, 0.02))
+
+
+if __name__ == '__main__':
+    unittest.main()
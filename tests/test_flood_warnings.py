@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from http.client import HTTPException
+from io import BytesIO
+from pathlib import Path
+
+from flood_nowcasting.flood_nowcasting import FloodNowcasting
+from flood_warnings import FloodAreaCache, get_flood_warnings
+from tests.data_fixtures import make_location
+
+FLOODS_URL = (Path(__file__).parent / "fixtures" / "floods.json").as_uri()
+
+
+class FloodAreaSearch:
+    """ stands in for the EA flood area search, counting requests and their timeouts """
+
+    def __init__(self, delay=0.0, fail_after=None):
+        self.delay = delay
+        self.fail_after = fail_after
+        self.urls = []
+        self.timeouts = []
+
+    def __call__(self, url, timeout=None):
+        self.urls.append(url)
+        self.timeouts.append(timeout)
+        if self.fail_after is not None and len(self.urls) > self.fail_after:
+            raise HTTPException("bad response")
+        time.sleep(self.delay)
+        return BytesIO(json.dumps({"items": [{"notation": "113FWFEXE2"}, {"notation": "113WAFEXE1"}]}).encode())
+
+
+class NoTwitterNowcasting(FloodNowcasting):
+    """ never connects to twitter """
+
+    def connect(self, account):
+        return None
+
+
+class TestFloodWarnings(unittest.TestCase):
+
+    def test_index(self):
+        index = get_flood_warnings(FLOODS_URL)
+        self.assertEqual({"113WAFEXE1", "113FWFEXE2", "113FWFCRD1"}, set(index.by_area))
+        warnings = index.for_location(
+            make_location(flood_areas=["113WAFEXE1", "113FWFEXE2", "113FWFCRD1", "unknown"]))
+        # most severe first, and not those no longer in force
+        self.assertEqual(["113FWFEXE2", "113WAFEXE1"], [warning.area_id for warning in warnings])
+        self.assertEqual("Flood warning", warnings[0].severity)
+        self.assertEqual([], index.for_location(make_location()))
+
+    def test_nowcasting(self):
+        nowcaster = NoTwitterNowcasting("a", "b", "c", "d", floods_url=FLOODS_URL)
+        flood_warnings = nowcaster.fetch_flood_warnings()
+        location = make_location(flood_areas=["113FWFEXE2"])
+        self.assertEqual(1, len(nowcaster.check_flood_warnings(location, flood_warnings)))
+        self.assertEqual([], nowcaster.check_flood_warnings(location, None))
+
+    def test_link_flood_areas(self):
+        search = FloodAreaSearch()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "flood_areas.json")
+            located, listed, nowhere = \
+                make_location(lat=50.7205, long=-3.533), make_location(flood_areas=["own"]), make_location()
+            FloodAreaCache(path).link([located, listed, nowhere], opener=search)
+            self.assertEqual(["113FWFEXE2", "113WAFEXE1"], located.flood_areas)
+            self.assertEqual(["own"], listed.flood_areas)
+            self.assertEqual((), nowhere.flood_areas)
+            self.assertEqual(["https://environment.data.gov.uk/flood-monitoring/id/floodAreas"
+                              "?lat=50.7205&long=-3.533&dist=1"], search.urls)
+
+            # looked up once, then from the cache
+            located = make_location(lat=50.7205, long=-3.533)
+            FloodAreaCache(path).link([located], opener=search)
+            self.assertEqual(["113FWFEXE2", "113WAFEXE1"], located.flood_areas)
+            self.assertEqual(1, len(search.urls))
+
+    def test_link_saves_as_it_goes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "flood_areas.json")
+            first, second = make_location(lat=50.7205, long=-3.533), make_location(lat=50.8, long=-3.6)
+            with self.assertRaises(HTTPException):
+                FloodAreaCache(path).link([first, second], opener=FloodAreaSearch(fail_after=1))
+            self.assertEqual(["50.7205,-3.533,1"], list(FloodAreaCache(path).areas))
+
+    def test_link_time_budget(self):
+        # the lookups share the time given, those not reached are left for the next run
+        search = FloodAreaSearch(delay=0.3)
+        locations = [make_location(lat=50.7, long=-3.5 - offset / 10) for offset in range(3)]
+        FloodAreaCache().link(locations, timeout=0.5, opener=search)
+        self.assertEqual(2, len(search.urls))
+        self.assertEqual((), locations[2].flood_areas)
+        self.assertLessEqual(search.timeouts[1], 0.2)
+
+    def test_unavailable(self):
+        nowcaster = NoTwitterNowcasting("a", "b", "c", "d", floods_url=FLOODS_URL + ".missing")
+        self.assertIsNone(nowcaster.fetch_flood_warnings())
+
+    def test_any_failure(self):
+        # such as a bad response, or a replay without the request
+        for error in (HTTPException("bad response"), LookupError("not recorded")):
+            def opener(url, timeout=None, error=error):
+                raise error
+            nowcaster = NoTwitterNowcasting("a", "b", "c", "d", floods_url=FLOODS_URL)
+            nowcaster.opener = opener
+            self.assertIsNone(nowcaster.fetch_flood_warnings([make_location(lat=50.7205, long=-3.533)]))
+
+
+if __name__ == '__main__':
+    unittest.main()
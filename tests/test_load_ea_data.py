@@ -5,9 +5,14 @@
 ###############################################################################
 
 import unittest
+from datetime import datetime
+from pathlib import Path
 
 from entities import Location, FloodStates
 from load_ea_data import get_data
+from replay import Cassette
+
+RUN = str(Path(__file__).parent / "fixtures" / "hand_built_run.json")
 
 
 class TestLoadEaData(unittest.TestCase):
@@ -19,12 +24,14 @@ class TestLoadEaData(unittest.TestCase):
             warn=0.5,
             messages={state: f"message {state.name}" for state in FloodStates}
         )
-        x_data, y_data = get_data(location)
+        cassette = Cassette(RUN)
+        x_data, y_data, latest = get_data(location, opener=cassette.urlopen)
         self.assertEqual(24, len(x_data))
         self.assertEqual(24, len(y_data))
-        x_data, y_data = get_data(location, 5)
+        x_data, y_data, latest = get_data(location, 5, opener=cassette.urlopen)
         self.assertEqual(5, len(x_data))
         self.assertEqual(5, len(y_data))
+        self.assertEqual(datetime(2021, 1, 28, 17, 45), latest)
         # check the last point in the sequence is within 5 minutes of where it should be
         self.assertAlmostEqual(min(x_data) + 4 * 60 * 15, max(x_data), delta=300)
 
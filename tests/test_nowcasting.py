@@ -1,12 +1,15 @@
 import unittest
+from pathlib import Path
 
 from entities import FloodStates
 from flood_nowcasting.flood_nowcasting import FloodNowcasting
+from replay import Cassette
 from tests.data_fixtures import EXE_SAMPLE_X, EXE_SAMPLE_Y, EXE_SAMPLE_OUTCOME, get_flat, ALL_STATES
 
 
 class TestNowcasting(unittest.TestCase):
-    flood_nowcasting = FloodNowcasting("a", "b", "c", "d")
+    flood_nowcasting = FloodNowcasting(
+        "a", "b", "c", "d", cassette=Cassette(str(Path(__file__).parent / "fixtures" / "hand_built_run.json")))
 
     def test_flat(self):
         forecast = self.flood_nowcasting.nowcast(*get_flat())
@@ -0,0 +1,136 @@
+import time
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from entities import Account, FloodStates
+from flood_nowcasting.flood_nowcasting import FloodNowcasting
+from tests.data_fixtures import EXE_SAMPLE_X, EXE_SAMPLE_Y, make_location
+
+
+class OfflineNowcasting(FloodNowcasting):
+    """ serves the sample data, hanging on the "slow" station """
+
+    def __init__(self, locations, accounts=(), timeout=0.1, publish_time=0.0, publish_timeout=0.1,
+                 warnings_time=0.0):
+        super().__init__("a", "b", "c", "d", floods_url=(Path(__file__).parent / "fixtures" / "floods.json").as_uri(),
+                         accounts=accounts, timeout=timeout, publish_timeout=publish_timeout)
+        self.locations = locations
+        self.publish_time = publish_time
+        self.warnings_time = warnings_time
+        self.fetched = []
+        self.published = []
+        self.looked_up = []
+
+    def get_locations(self):
+        return self.locations
+
+    def connect(self, account):
+        return None
+
+    def fetch(self, location, timeout=None):
+        self.fetched.append(location.monitoring_station)
+        if location.monitoring_station == "slow":
+            time.sleep(2)
+        if location.monitoring_station == "broken":
+            raise IOError("no data")
+        return EXE_SAMPLE_X[:24], EXE_SAMPLE_Y[:24], datetime(2021, 1, 28, 17, 45)
+
+    def fetch_flood_warnings(self, locations=(), timeout=None):
+        if self.warnings_time is None:
+            raise IOError("no warnings")
+        time.sleep(self.warnings_time)
+        return super().fetch_flood_warnings(locations, timeout)
+
+    def get_current_output_states(self, locations, suffix_len, account=None, timeout=None):
+        self.looked_up.append(account.name)
+        # the second account has already published WET for everything
+        return {location.name: FloodStates.WET if account.name == "second" else FloodStates.DRY
+                for location in locations}
+
+    def publish(self, message, account=None, timeout=None):
+        time.sleep(self.publish_time)
+        self.published.append(message if account.name == "ExeFloodChannel" else f"{account.name}: {message}")
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_all_complete(self):
+        nowcaster = OfflineNowcasting([make_location("one", "1"), make_location("two", "1"),
+                                       make_location("three", "2")])
+        results = nowcaster.run(5)["ExeFloodChannel"]
+        self.assertEqual({"one": FloodStates.WET, "two": FloodStates.WET, "three": FloodStates.WET},
+                         {name: status.state for name, status in results.items()})
+        self.assertEqual(EXE_SAMPLE_Y[23], results["one"].level)
+        # one request per station
+        self.assertEqual(["1", "2"], sorted(nowcaster.fetched))
+        self.assertEqual(3, len(nowcaster.published))
+
+    def test_partial_results(self):
+        nowcaster = OfflineNowcasting([make_location("fast", "1"), make_location("slow", "slow"),
+                                       make_location("broken", "broken")])
+        start = time.monotonic()
+        results = nowcaster.run(0.5)["ExeFloodChannel"]
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(FloodStates.WET, results["fast"].state)
+        self.assertEqual({"slow": None, "broken": None}, {name: results[name] for name in ("slow", "broken")})
+        self.assertEqual(["fast WET (using data issued at:  05:45 PM 28/01/2021)"], nowcaster.published)
+
+    def test_no_time_to_publish(self):
+        # the publish timeout is longer than the time left, so don't start a publish that may not finish
+        nowcaster = OfflineNowcasting([make_location("fast", "1")], publish_timeout=1)
+        self.assertEqual({"fast": None}, nowcaster.run(0.5)["ExeFloodChannel"])
+        self.assertEqual([], nowcaster.published)
+
+    def test_publish_seen_through(self):
+        # started in time but finishing after the time limit - it has gone out, so it's waited for and reported
+        nowcaster = OfflineNowcasting([make_location("fast", "1"), make_location("slow", "slow")],
+                                      publish_time=1, publish_timeout=0.5)
+        results = nowcaster.run(0.7)["ExeFloodChannel"]
+        self.assertEqual(FloodStates.WET, results["fast"].state)
+        self.assertIsNone(results["slow"])
+        self.assertEqual(1, len(nowcaster.published))
+
+    def test_slow_warnings(self):
+        # the tweet has gone out, so the result can't be lost waiting on the informational warnings
+        nowcaster = OfflineNowcasting([make_location("fast", "1")], timeout=5, warnings_time=3)
+        start = time.monotonic()
+        results = nowcaster.run(1)["ExeFloodChannel"]
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(FloodStates.WET, results["fast"].state)
+        self.assertEqual([], results["fast"].warnings)
+        self.assertEqual(1, len(nowcaster.published))
+
+    def test_failed_warnings(self):
+        nowcaster = OfflineNowcasting([make_location("fast", "1")], warnings_time=None)
+        results = nowcaster.run(1)["ExeFloodChannel"]
+        self.assertEqual(FloodStates.WET, results["fast"].state)
+        self.assertEqual([], results["fast"].warnings)
+        self.assertEqual(1, len(nowcaster.published))
+
+    def test_accounts_share_data(self):
+        locations = [make_location("one", "1"), make_location("two", "1"), make_location("three", "2")]
+        accounts = [Account("second", "SecondChannel", "e", "f", "g", "h", ["one", "three"]),
+                    Account("third", "ThirdChannel", "i", "j", "k", "l", ["two"])]
+        nowcaster = OfflineNowcasting(locations, accounts)
+        results = nowcaster.run()
+        # one request per station, one lookup per account
+        self.assertEqual(["1", "2"], sorted(nowcaster.fetched))
+        self.assertEqual(["ExeFloodChannel", "second", "third"], sorted(nowcaster.looked_up))
+        # second already shows WET so has nothing to publish
+        self.assertEqual(["one WET", "third: two WET", "three WET", "two WET"],
+                         sorted(message.split(" (")[0] for message in nowcaster.published))
+        self.assertEqual({"ExeFloodChannel": 3, "second": 2, "third": 1},
+                         {account: len(statuses) for account, statuses in results.items()})
+
+    def test_account_names(self):
+        # one would replace the other, or write its feed over the other's
+        for name in ("ExeFloodChannel", "Locations", "second!", "!"):
+            accounts = [Account("second", "SecondChannel", "e", "f", "g", "h"),
+                        Account(name, "ThirdChannel", "i", "j", "k", "l")]
+            with self.assertRaises(ValueError):
+                OfflineNowcasting([], accounts)
+
+
+if __name__ == '__main__':
+    unittest.main()
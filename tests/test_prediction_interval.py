@@ -0,0 +1,95 @@
+import unittest
+
+import numpy as np
+
+from entities import FloodStates
+from flood_nowcasting.flood_nowcasting import FloodNowcasting
+from prediction_interval import ANALYTIC, BOOTSTRAP, forecast_interval
+from tests.data_fixtures import EXE_SAMPLE_X, EXE_SAMPLE_Y, get_flat, make_location
+
+HORIZONS = (1800, 3600)
+
+
+class TestPredictionInterval(unittest.TestCase):
+
+    def test_flat(self):
+        for method in (ANALYTIC, BOOTSTRAP):
+            forecast, lower, upper = forecast_interval(*get_flat(), HORIZONS, 0.8, method=method, seed=1)
+            np.testing.assert_allclose([5, 5], forecast, atol=1e-6)
+            np.testing.assert_allclose(forecast, lower, atol=1e-6)
+            np.testing.assert_allclose(forecast, upper, atol=1e-6)
+
+    def test_matches_nowcast(self):
+        x_values, y_values = EXE_SAMPLE_X[:24], EXE_SAMPLE_Y[:24]
+        forecast, lower, upper = forecast_interval(x_values, y_values, HORIZONS, 0.8)
+        np.testing.assert_allclose(FloodNowcasting.nowcast(x_values, y_values), forecast, atol=1e-6)
+        self.assertTrue(np.all(lower < forecast))
+        self.assertTrue(np.all(upper > forecast))
+        # symmetric and widening further ahead
+        np.testing.assert_allclose(upper - forecast, forecast - lower)
+        self.assertGreater(upper[1] - lower[1], upper[0] - lower[0])
+
+    def test_wider_with_confidence(self):
+        x_values, y_values = EXE_SAMPLE_X[:24], EXE_SAMPLE_Y[:24]
+        for method in (ANALYTIC, BOOTSTRAP):
+            _, lower_80, upper_80 = forecast_interval(x_values, y_values, HORIZONS, 0.8, method=method, seed=1)
+            _, lower_95, upper_95 = forecast_interval(x_values, y_values, HORIZONS, 0.95, method=method, seed=1)
+            self.assertTrue(np.all(upper_95 > upper_80))
+            self.assertTrue(np.all(lower_95 < lower_80))
+
+    def test_bootstrap_close_to_analytic(self):
+        rng = np.random.default_rng(0)
+        x_values = np.arange(24) * 900
+        y_values = 3.8 + 1e-5 * x_values + rng.normal(0, 0.005, 24)
+        _, _, analytic = forecast_interval(x_values, y_values, HORIZONS, 0.8)
+        _, _, bootstrap = forecast_interval(x_values, y_values, HORIZONS, 0.8, method=BOOTSTRAP, resamples=5000, seed=1)
+        np.testing.assert_allclose(analytic, bootstrap, atol=0.005)
+
+    def test_vectorised_over_series(self):
+        series = np.array([EXE_SAMPLE_Y[start:start + 24] for start in range(0, 60, 10)])
+        forecast, lower, upper = forecast_interval(EXE_SAMPLE_X[:24], series, HORIZONS, 0.8)
+        self.assertEqual((6, 2), upper.shape)
+        for row, y_values in enumerate(series):
+            single = forecast_interval(EXE_SAMPLE_X[:24], y_values, HORIZONS, 0.8)
+            np.testing.assert_allclose(single[0], forecast[row])
+            np.testing.assert_allclose(single[1], lower[row])
+            np.testing.assert_allclose(single[2], upper[row])
+
+    def test_vectorised_over_confidence(self):
+        x_values, y_values = EXE_SAMPLE_X[:24], EXE_SAMPLE_Y[:24]
+        for method in (ANALYTIC, BOOTSTRAP):
+            forecast, lower, upper = forecast_interval(x_values, y_values, HORIZONS, [0.8, 0.95], method=method,
+                                                       seed=1)
+            self.assertEqual((2, 2), upper.shape)
+            for row, confidence in enumerate([0.8, 0.95]):
+                single = forecast_interval(x_values, y_values, HORIZONS, confidence, method=method, seed=1)
+                np.testing.assert_allclose(single[0], forecast)
+                np.testing.assert_allclose(single[1], lower[row])
+                np.testing.assert_allclose(single[2], upper[row])
+
+    def test_forecast_per_station(self):
+        x_values, y_values = EXE_SAMPLE_X[:24], EXE_SAMPLE_Y[:24]
+        locations = [make_location(str(confidence), confidence=confidence) for confidence in (None, 0.8, 0.95)]
+        forecasts = FloodNowcasting.forecast(locations, x_values, y_values)
+        self.assertIsNone(forecasts["None"][1])
+        for confidence in (0.8, 0.95):
+            forecast, _, upper = forecast_interval(x_values, y_values, HORIZONS, confidence)
+            np.testing.assert_allclose(forecast, forecasts[str(confidence)][0])
+            np.testing.assert_allclose(upper, forecasts[str(confidence)][1])
+        np.testing.assert_allclose(FloodNowcasting.nowcast(x_values, y_values), forecasts["None"][0], atol=1e-6)
+
+    def test_too_few_readings(self):
+        with self.assertRaises(ValueError):
+            forecast_interval([0, 900, 1800], [1, 2, 3], HORIZONS, 0.8)
+
+    def test_state_uses_upper_bound(self):
+        # the bare forecast stays under warn, the upper bound crosses it
+        args = {"prior_state": FloodStates.DRY, "current_level": 8, "forecast": np.array([9, 9.5]),
+                "warn_threshold": 10, "wet_threshold": 20}
+        self.assertEqual(FloodStates.DRY, FloodNowcasting.calculate_new_state(**args))
+        self.assertEqual(FloodStates.WARN,
+                         FloodNowcasting.calculate_new_state(**args, forecast_upper=np.array([9.5, 10.5])))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from flood_nowcasting.flood_nowcasting import FloodNowcasting
+from flood_warnings import get_flood_warnings
+from replay import Cassette
+
+FIXTURES = Path(__file__).parent / "fixtures"
+# put together by hand from the sample data, not a recording - its published messages are the expected outcome, but
+# its timings are made up
+RUN = str(FIXTURES / "hand_built_run.json")
+
+
+class TestReplay(unittest.TestCase):
+
+    def test_main(self):
+        cassette = Cassette(RUN)
+        nowcaster = FloodNowcasting("a", "b", "c", "d", cassette=cassette)
+        self.assertIsNone(nowcaster.api)
+        nowcaster.main()
+        self.assertEqual(sorted(cassette.recorded_published()), sorted(cassette.published))
+
+    def test_run(self):
+        cassette = Cassette(RUN)
+        results = FloodNowcasting("a", "b", "c", "d", cassette=cassette, publish_timeout=1).run(5)
+        self.assertEqual({"Millers Crossing and the Quay": "WET", "St David's and Millers Crossing": "DRY"},
+                         {name: status.state.name for name, status in results["ExeFloodChannel"].items()})
+        self.assertEqual(sorted(cassette.recorded_published()), sorted(cassette.published))
+
+    def test_not_recorded(self):
+        with self.assertRaises(LookupError):
+            Cassette(RUN).urlopen("https://example.com/missing")
+
+    def test_record(self):
+        floods_url = (FIXTURES / "floods.json").as_uri()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "recording.json.gz")
+            recording = Cassette(path, record=True)
+            recorded = get_flood_warnings(floods_url, opener=recording.urlopen)
+            sent = []
+            recording.publish("ExeFloodChannel", "message", lambda: (time.sleep(0.2), sent.append("message")))
+            pages = list(recording.pages("ExeFloodChannel", lambda: iter([["one", "two"], ["three"]])))
+            recording.save()
+            self.assertEqual(["message"], sent)
+
+            replay = Cassette(path)
+            self.assertEqual(recorded.by_area, get_flood_warnings(floods_url, opener=replay.urlopen).by_area)
+            self.assertEqual(pages, list(replay.pages("ExeFloodChannel", lambda: self.fail("no network"))))
+            replay.publish("ExeFloodChannel", "message", lambda: self.fail("no network"))
+            self.assertEqual([("ExeFloodChannel", "message")], replay.recorded_published())
+            self.assertEqual(replay.recorded_published(), replay.published)
+
+            # played back with the time the publish really took
+            start = time.monotonic()
+            Cassette(path, realtime=True).publish("ExeFloodChannel", "message", lambda: self.fail("no network"))
+            self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+from station_catalogue import Station, StationCatalogue, distance_km, fetch_stations, parse_station
+
+
+def random_stations(count: int, seed: int = 1):
+    generator = random.Random(seed)
+    return [Station(str(index), f"gauge {index}", generator.choice(["Exe", "Creedy", None]),
+                    generator.uniform(50.0, 51.5), generator.uniform(-4.5, -2.5)) for index in range(count)]
+
+
+class TestStationCatalogue(unittest.TestCase):
+
+    def test_nearest_matches_brute_force(self):
+        stations = random_stations(2000)
+        catalogue = StationCatalogue(stations)
+        generator = random.Random(2)
+        for _ in range(50):
+            lat, long = generator.uniform(49.5, 52), generator.uniform(-5, -2)
+            for river in (None, "Creedy"):
+                expected = sorted((station for station in stations if river is None or station.river == river),
+                                  key=lambda station: distance_km(lat, long, station.lat, station.long))[:5]
+                found = catalogue.nearest(lat, long, 5, river)
+                self.assertEqual(expected, [station for station, _ in found])
+
+    def test_nearest_on_sparse_river(self):
+        stations = random_stations(500) + [Station(f"yeo {index}", "yeo", "Yeo", 50.8 + index / 100, -3.7)
+                                           for index in range(3)]
+        found = StationCatalogue(stations).nearest(50.72, -3.53, 2, "Yeo")
+        self.assertEqual(["yeo 0", "yeo 1"], [station.reference for station, _ in found])
+        self.assertEqual([], StationCatalogue(stations).nearest(50.72, -3.53, 2, "Otter"))
+
+    def test_empty(self):
+        self.assertEqual([], StationCatalogue([]).nearest(50.7, -3.5))
+
+    def test_merge_area(self):
+        near = Station("near", "near", "Exe", 50.72, -3.53)
+        far = Station("far", "far", "Exe", 51.5, -0.1)
+        moved = Station("new", "new", "Exe", 50.73, -3.54)
+        catalogue = StationCatalogue([near, far])
+        # the area download no longer has "near" - it closed
+        catalogue.merge([moved], 50.72, -3.53, 10)
+        self.assertEqual({"far", "new"}, set(catalogue.stations))
+        self.assertEqual(moved, catalogue.nearest(50.72, -3.53)[0][0])
+
+    def test_save_load(self):
+        catalogue = StationCatalogue(random_stations(100), etag="abc")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stations.json.gz")
+            catalogue.save(path)
+            loaded = StationCatalogue.load(path)
+        self.assertEqual(catalogue.stations, loaded.stations)
+        self.assertEqual("abc", loaded.etag)
+
+    def test_fetch(self):
+        items = [
+            {"stationReference": "45128", "label": "Exeter Trews Weir", "riverName": "River Exe",
+             "lat": 50.7135, "long": -3.5245},
+            {"stationReference": "moved", "label": ["old", "new"], "lat": [50.0, 50.1], "long": [-3.0, -3.1]},
+            {"stationReference": "nowhere", "label": "no position"}
+        ]
+        self.assertEqual(Station("moved", "new", None, 50.1, -3.1), parse_station(items[1]))
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "stations.json"
+            path.write_text(json.dumps({"items": items}))
+            stations, _ = fetch_stations(path.as_uri())
+        self.assertEqual(["45128", "moved"], [station.reference for station in stations])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from entities import FloodStates
+from flood_warnings import FloodWarning
+from status_feed import LocationStatus, slug, write_status_feed
+from tests.data_fixtures import make_location
+
+
+QUAY = make_location("Millers Crossing and the Quay", lat=50.72, long=-3.53)
+ST_DAVIDS = make_location("St David's and Millers Crossing", lat=50.73, long=-3.54)
+NOWHERE = make_location("No position")
+TIMESTAMP = datetime(2021, 1, 28, 17, 45)
+
+
+class TestStatusFeed(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def read(self, name):
+        with open(os.path.join(self.directory.name, name), encoding='utf-8') as handle:
+            return json.load(handle)
+
+    def test_slug(self):
+        self.assertEqual("st-david-s-and-millers-crossing", slug(ST_DAVIDS.name))
+
+    def test_incremental(self):
+        warning = FloodWarning("113FWFEXE2", "River Exe at Exeter Quay", "Flood warning", 2, None, None)
+        statuses = [LocationStatus(QUAY, FloodStates.WET, 3.9, [3.91, 3.92], TIMESTAMP, [warning]),
+                    LocationStatus(ST_DAVIDS, FloodStates.DRY, 3.9, [3.91, 3.92], TIMESTAMP),
+                    LocationStatus(NOWHERE, FloodStates.DRY, 3.9, [3.91, 3.92], TIMESTAMP)]
+        self.assertEqual(5, len(write_status_feed(self.directory.name, statuses)))
+
+        entry = self.read("locations/millers-crossing-and-the-quay.json")
+        self.assertEqual("WET", entry["state"])
+        self.assertEqual("2021-01-28T17:45:00Z", entry["data_timestamp"])
+        self.assertEqual("Flood warning", entry["flood_warnings"][0]["severity"])
+        geojson = self.read("status.geojson")
+        self.assertEqual(2, len(geojson["features"]))
+        self.assertEqual([-3.53, 50.72], geojson["features"][0]["geometry"]["coordinates"])
+
+        # nothing changed - nothing written
+        self.assertEqual([], write_status_feed(self.directory.name, statuses))
+
+        # only the changed shard, and the files listing it
+        etag = self.read("index.json")["locations"]["millers-crossing-and-the-quay"]["etag"]
+        written = write_status_feed(self.directory.name, [
+            LocationStatus(ST_DAVIDS, FloodStates.WARN, 3.95, [3.99, 4.01], TIMESTAMP)])
+        self.assertEqual(["st-david-s-and-millers-crossing.json", "status.geojson", "index.json"],
+                         [os.path.basename(path) for path in written])
+        index = self.read("index.json")["locations"]
+        self.assertEqual("WARN", index["st-david-s-and-millers-crossing"]["state"])
+        # missing from the run, keeps its last entry
+        self.assertEqual(etag, index["millers-crossing-and-the-quay"]["etag"])
+
+    def test_removed_location(self):
+        statuses = [LocationStatus(QUAY, FloodStates.WET, 3.9, [3.91, 3.92], TIMESTAMP),
+                    LocationStatus(ST_DAVIDS, FloodStates.DRY, 3.9, [3.91, 3.92], TIMESTAMP)]
+        write_status_feed(self.directory.name, statuses)
+        # the quay is no longer configured, st david's is but didn't finish
+        written = write_status_feed(self.directory.name, [], [ST_DAVIDS.name])
+        self.assertEqual(["millers-crossing-and-the-quay.json", "status.geojson", "index.json"],
+                         [os.path.basename(path) for path in written])
+        self.assertFalse(os.path.exists(os.path.join(self.directory.name, written[0])))
+        self.assertEqual(["st-david-s-and-millers-crossing"], list(self.read("index.json")["locations"]))
+        self.assertEqual(["st-david-s-and-millers-crossing"],
+                         [feature["id"] for feature in self.read("status.geojson")["features"]])
+
+
+if __name__ == '__main__':
+    unittest.main()